@@ -4,11 +4,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import uuid
-from utils.extract import extract_pdf, display_pdf
-from utils.preprocess import clean_text, detect_topics
-from utils.embed import semantic_chunks, build_faiss_index, embed_model
+import numpy as np
+from utils.extract import extract_pages_many, iter_pdf_pages, file_digest, pdf_page_count, can_render_pages, render_pdf_page, display_pdf_pages
+from utils.preprocess import clean_text, join_pages, detect_topics
+from utils.embed import semantic_chunk_spans, iter_stream_chunk_spans
+from utils.embed_service import get_embedding_service
+from utils.corpus import Corpus
+from utils.library import corpus_id, load_entry, load_provenance, load_text, save_entry
 from utils.rag import retrieve
-from utils.llm import generate_summary, answer_with_context
+from utils.context import pack_context
+from utils.answer_cache import lookup_answer, store_answer
+from utils.llm_cache import cache_stats as llm_cache_stats
+from utils.llm import generate_summary_stream, map_reduce_summary_stream, summary_sections, answer_with_context_stream
 from utils.export import export_text_to_pdf
 from utils.notes_db import init_db, save_chat, get_chats, save_note, get_notes, save_flashcard, get_flashcards, delete_note, update_note
 from utils.flashcards import generate_flashcards_from_text
@@ -87,6 +94,34 @@ max_chunk_words = st.sidebar.slider(
     100, 800, 450,
     help="Size of text chunks for processing"
 )
+context_budget = st.sidebar.slider(
+    "Context budget (tokens)",
+    300, 4000, 1500, step=100,
+    help="Upper bound on retrieved text sent to the LLM with each question"
+)
+retrieval_mode = st.sidebar.selectbox(
+    "Retrieval mode",
+    ["hybrid", "dense", "lexical"],
+    help="Hybrid fuses keyword (BM25) and semantic search; lexical is keyword-only and skips the embedding model"
+)
+vector_compression = st.sidebar.selectbox(
+    "Vector compression",
+    ["none", "fp16", "sq8", "pq"],
+    help="Store index vectors as float16, 8-bit scalars or product-quantized codes to save memory (slightly lower recall)"
+)
+stream_ingest = st.sidebar.checkbox(
+    "Stream pages while indexing",
+    value=False,
+    help="Clean, chunk and embed each page as it is parsed instead of waiting for the whole document"
+)
+reuse_answers = st.sidebar.checkbox(
+    "Reuse answers to similar questions",
+    value=True,
+    help="Answer paraphrases of a question already asked about the same documents from the answer cache "
+         "(not in lexical mode, which never loads the embedding model)"
+)
+llm_stats = llm_cache_stats()
+st.sidebar.caption(f"LLM response cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses, {llm_stats['entries']} stored")
 
 
 
@@ -113,32 +148,127 @@ if uploaded_files:
     for f in uploaded_files:
         st.sidebar.markdown(f"- 📄 **{f.name}**")
     
-    combined_text = ""
-    file_names = []
-    for f in uploaded_files:
-        file_names.append(f.name)
-        combined_text += extract_pdf(f) + "\n\n"
-
-    combined_text = clean_text(combined_text)
-    st.session_state["combined_text"] = combined_text
+    file_names = [f.name for f in uploaded_files]
+    digests = [file_digest(f) for f in uploaded_files]
+
+    # one incrementally updated corpus per session, replaced only when chunking/index settings change
+    corpus_key = (max_chunk_words, vector_compression)
+    if st.session_state.get("corpus_key") != corpus_key:
+        st.session_state["corpus"] = Corpus(compression=vector_compression)
+        st.session_state["corpus_key"] = corpus_key
+    corpus = st.session_state["corpus"]
+    model_key = get_embedding_service().cache_key
+
+    # removed uploads drop their ids; only new uploads are chunked and embedded.
+    # A document a rerun interrupted mid-ingest is dropped and ingested again.
+    for doc_id in [d for d in corpus.documents() if d not in digests] + corpus.incomplete():
+        corpus.remove_document(doc_id)
+    new_files = []
+    seen = set()
+    for doc_id, f in zip(digests, uploaded_files):
+        # the same PDF uploaded twice (e.g. under another name) is ingested once
+        if doc_id in corpus.complete or doc_id in seen:
+            continue
+        seen.add(doc_id)
+        lib_id = corpus_id([doc_id], max_chunk_words, model_key)
+        saved = load_entry(lib_id)
+        prov = load_provenance(lib_id)
+        text = load_text(lib_id) if saved is not None else None
+        if saved is not None and saved[0] is not None and prov is not None and text is not None:
+            # spans, vectors and text from the library, no extraction, chunking or encoding
+            corpus.add_document(doc_id, None, saved[0], name=f.name, text=text,
+                                spans=np.stack([prov["start"], prov["end"]], axis=1), pages=prov["page"])
+            corpus.mark_complete(doc_id)
+        else:
+            new_files.append((doc_id, f))
+
+    def _save_document(doc_id, f):
+        ids = corpus.doc_ids[doc_id]
+        # spans + text rather than chunk strings; vectors in the store dtype, memory-mapped back on the next load
+        save_entry(corpus_id([doc_id], max_chunk_words, model_key),
+                   embeddings=corpus.embeddings[ids].astype(corpus.store_dtype),
+                   provenance=corpus.provenance_table[ids], text=corpus.full_text([doc_id]),
+                   files=[f.name], max_words=max_chunk_words, model=model_key)
+        corpus.mark_complete(doc_id)
+
+    def _buffered_pages(doc_id, f):
+        # cleaned pages go into the corpus text buffer first, so chunks are stored as offsets into it
+        for page_no, ptext in iter_pdf_pages(f):
+            ptext = clean_text(ptext)
+            if ptext:
+                corpus.append_text(doc_id, ptext, name=f.name)
+            yield page_no, ptext
+
+    if new_files and stream_ingest:
+        # pages are cleaned, chunked and embedded while later pages are still parsing
+        status = st.empty()
+        for doc_id, f in new_files:
+            batch, spans, pages = [], [], []
+            for page_no, chunk, start, end in iter_stream_chunk_spans(_buffered_pages(doc_id, f), max_words=max_chunk_words):
+                batch.append(chunk)
+                spans.append((start, end))
+                pages.append(page_no)
+                if len(batch) >= 32:
+                    corpus.add_document(doc_id, batch, name=f.name, spans=spans, pages=pages)
+                    batch, spans, pages = [], [], []
+                    status.caption(f"Indexed {len(corpus)} chunks ({f.name}, page {page_no})")
+            corpus.add_document(doc_id, batch, name=f.name, spans=spans, pages=pages)
+            _save_document(doc_id, f)
+        status.empty()
+    elif new_files:
+        with st.spinner("Creating semantic chunks & building index..."):
+            for (doc_id, f), fpages in zip(new_files, extract_pages_many([f for _, f in new_files])):
+                doc_text, page_starts, page_numbers = join_pages(fpages)
+                doc_chunks, spans, pages = semantic_chunk_spans(doc_text, max_words=max_chunk_words,
+                                                                page_starts=page_starts, page_numbers=page_numbers)
+                corpus.add_document(doc_id, doc_chunks, name=f.name, spans=spans, pages=pages, text=doc_text)
+                _save_document(doc_id, f)
+
+    def combined_text():
+        # built on demand from the per-document buffers the chunks already point into
+        return corpus.full_text(list(dict.fromkeys(digests)))
 
     # left column: preview & summary
     with col1:
         st.markdown(f"### {get_decorative_emoji('pdf')} PDF Preview")
-        # show first PDF preview
-        st.markdown(display_pdf(uploaded_files[0]), unsafe_allow_html=True)
+        # preview one page at a time instead of shipping the whole PDF every rerun
+        preview_file = uploaded_files[0]
+        if len(uploaded_files) > 1:
+            preview_name = st.selectbox("File", file_names, key="preview_file")
+            preview_file = uploaded_files[file_names.index(preview_name)]
+        n_pages = pdf_page_count(preview_file)
+        preview_page = st.number_input("Page", min_value=1, max_value=max(n_pages, 1), value=1, step=1, key="preview_page") if n_pages > 1 else 1
+        if can_render_pages():
+            st.image(render_pdf_page(preview_file, int(preview_page)), use_container_width=True)
+        else:
+            st.markdown(display_pdf_pages(preview_file, [int(preview_page)]), unsafe_allow_html=True)
 
         st.markdown("---")
         st.markdown(f"### {get_decorative_emoji('summary')} Quick Summary")
         
+        whole_document = st.checkbox(
+            "Summarize the whole document",
+            value=True,
+            help="Summarize every section in parallel and merge the notes (map-reduce) instead of only the first pages"
+        )
         if st.button(f"{get_decorative_emoji('generate')} Generate Summary", use_container_width=True):
-            with st.spinner("Generating summary..."):
-                st.session_state.quick_summary = generate_summary(
-                    combined_text[:6000],
-                    llm=("ollama" if selected_llm=="ollama" else "groq"),
-                    model=model_option,
-                    temperature=temperature
-                )
+            live_summary = st.empty()
+            summary = ""
+            summary_llm = "ollama" if selected_llm=="ollama" else "groq"
+            summary_text = combined_text()
+            if whole_document and len(summary_sections(summary_text)) > 1:
+                with st.spinner("Summarizing sections..."):
+                    summary_stream = map_reduce_summary_stream(summary_text, llm=summary_llm,
+                                                               model=model_option, temperature=temperature)
+            else:
+                # a document that fits in one section streams directly, without the map step
+                summary_stream = generate_summary_stream(summary_text if whole_document else summary_text[:6000],
+                                                         llm=summary_llm, model=model_option, temperature=temperature)
+            for token in summary_stream:
+                summary += token
+                live_summary.markdown(summary + "▌")
+            live_summary.empty()
+            st.session_state.quick_summary = summary
         
         # Display summary if it exists
         if "quick_summary" in st.session_state and st.session_state.quick_summary:
@@ -160,10 +290,7 @@ if uploaded_files:
                 st.success("Saved to Notes!")
                 st.balloons()
 
-    # build chunks & index
-    with st.spinner("Creating semantic chunks & building index..."):
-        chunks = semantic_chunks(combined_text, max_words=max_chunk_words)
-        index, embeddings = build_faiss_index(chunks)
+    chunks, index, embeddings = corpus.chunks, corpus.index, corpus.embeddings
     st.session_state["chunks"] = chunks
     st.session_state["index"] = index
     st.session_state["embeddings"] = embeddings
@@ -186,16 +313,35 @@ if uploaded_files:
             with st.spinner("🤔 Thinking..."):
                 # save user message
                 save_chat(st.session_state.session_id, "user", user_input)
-                # retrieve top-k chunks
-                retrieved = retrieve(user_input, index, embeddings, chunks, top_k=top_k)
-                # answer using chosen LLM
-                result = answer_with_context(
-                    user_input, 
-                    retrieved, 
-                    llm=("ollama" if selected_llm=="ollama" else "groq"), 
-                    model=model_option, 
-                    temperature=temperature
-                )
+                # same documents, chunking and embedding model -> same fingerprint
+                answer_corpus = corpus_id(set(digests), max_chunk_words, model_key)
+                answer_model = f"{selected_llm}/{model_option}"
+                # the answer cache matches questions by embedding; lexical mode never loads the model
+                use_answer_cache = reuse_answers and retrieval_mode != "lexical"
+                result = lookup_answer(user_input, answer_corpus, answer_model) if use_answer_cache else None
+                if result is None:
+                    # retrieve top-k chunks
+                    retrieved = retrieve(user_input, index, embeddings, chunks, top_k=top_k, index_version=corpus.version,
+                                         bm25=corpus.bm25, mode=retrieval_mode, provenance=corpus.provenance)
+                    # drop near-duplicate chunks and trim to the prompt token budget
+                    retrieved = pack_context(user_input, retrieved, embeddings, token_budget=context_budget)
+                    # answer using chosen LLM, rendering tokens as they arrive
+                    result = answer_with_context_stream(
+                        user_input, 
+                        retrieved, 
+                        llm=("ollama" if selected_llm=="ollama" else "groq"), 
+                        model=model_option, 
+                        temperature=temperature
+                    )
+                    live_answer = st.empty()
+                    answer = ""
+                    for token in result.pop("stream"):
+                        answer += token
+                        live_answer.markdown(answer + "▌")
+                    live_answer.empty()  # the finished answer is shown in the history below
+                    result["answer"] = answer.strip()
+                    if use_answer_cache:
+                        store_answer(user_input, answer_corpus, answer_model, result)
                 answer = result["answer"]
                 used_chunks = result["used_chunks"]
                 # save assistant message
@@ -243,7 +389,10 @@ if uploaded_files:
                             chunk_content = uc.get('chunk', '')
                             if chunk_content:
                                 chunk_str = str(chunk_content)
-                                st.markdown(f"**Source #{idx + 1}** (relevance: {uc.get('norm_score', 0):.0%})")
+                                where = uc.get('file') or ""
+                                if uc.get('page'):
+                                    where += f", page {uc['page']}"
+                                st.markdown(f"**Source #{idx + 1}**{' — ' + where if where else ''} (relevance: {uc.get('norm_score', 0):.0%})")
                                 st.text(chunk_str[:500] + ("..." if len(chunk_str) > 500 else ""))
                                 st.markdown("---")
                 
@@ -343,7 +492,7 @@ if uploaded_files:
             with st.spinner("Creating flashcards from your document..."):
                 # Use clean text directly instead of summary
                 # This avoids markdown formatting issues
-                clean_content = combined_text[:8000]
+                clean_content = combined_text()[:8000]
                 
                 # Generate flashcards using LLM
                 cards = generate_flashcards_from_text(
@@ -0,0 +1,100 @@
+# benchmarks/bench_ann.py
+"""
+Recall@k and single-query latency of the index types chosen by
+utils.embed.make_index, on synthetic clustered unit vectors.
+
+    python -m benchmarks.bench_ann [n_vectors ...]
+
+Recall is measured against the exact IndexFlatIP results for the same queries.
+A second table compares the compression modes (fp16 / sq8 / pq) by
+serialized bytes per vector and recall, for the flat and IVF layouts.
+"""
+import sys
+import time
+import numpy as np
+import faiss
+
+from utils.embed import make_index
+from utils.rag import set_search_params
+
+DIM = 384
+N_QUERIES = 500
+TOP_K = 5
+
+
+def synthetic_vectors(n, dim=DIM, n_clusters=200, seed=0):
+    """Unit vectors around random centroids; closer to real embeddings than pure noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((n_clusters, dim)).astype("float32")
+    x = centroids[rng.integers(0, n_clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def latencies_ms(index, queries, k):
+    out = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q[None, :], k)
+        out.append((time.perf_counter() - start) * 1000)
+    return np.array(out)
+
+
+def run(n):
+    data = synthetic_vectors(n)
+    queries = synthetic_vectors(N_QUERIES, seed=1)
+    flat = make_index(data, kind="flat")
+    _, truth = flat.search(queries, TOP_K)
+
+    configs = [("flat", {}), ("hnsw", {"ef_search": 32}), ("hnsw", {"ef_search": 64}),
+               ("hnsw", {"ef_search": 128}), ("ivf", {"nprobe": 8}), ("ivf", {"nprobe": 16}),
+               ("ivf", {"nprobe": 64})]
+    built = {}
+    print(f"\nn={n}")
+    print(f"{'index':>8} {'param':>14} {'build s':>8} {'recall@5':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, params in configs:
+        if kind not in built:
+            start = time.perf_counter()
+            built[kind] = (make_index(data, kind=kind), time.perf_counter() - start)
+        index, build_s = built[kind]
+        set_search_params(index, **params)
+        _, found = index.search(queries, TOP_K)
+        lat = latencies_ms(index, queries, TOP_K)
+        label = ",".join(f"{k}={v}" for k, v in params.items()) or "-"
+        print(f"{kind:>8} {label:>14} {build_s:>8.2f} {recall_at_k(found, truth):>9.3f} "
+              f"{np.percentile(lat, 50):>8.3f} {np.percentile(lat, 99):>8.3f}")
+
+
+def run_compression(n):
+    data = synthetic_vectors(n)
+    queries = synthetic_vectors(N_QUERIES, seed=1)
+    _, truth = make_index(data, kind="flat").search(queries, TOP_K)
+    print(f"\nn={n} compression")
+    print(f"{'index':>8} {'codec':>6} {'bytes/vec':>10} {'ratio':>6} {'recall@5':>9} {'p50 ms':>8}")
+    baseline = None
+    for kind in ("flat", "ivf"):
+        for compression in ("none", "fp16", "sq8", "pq"):
+            index = make_index(data, kind=kind, compression=compression)
+            set_search_params(index, nprobe=16)
+            per_vec = len(faiss.serialize_index(index)) / n
+            baseline = baseline or per_vec
+            _, found = index.search(queries, TOP_K)
+            lat = latencies_ms(index, queries, TOP_K)
+            print(f"{kind:>8} {compression:>6} {per_vec:>10.1f} {baseline / per_vec:>5.1f}x "
+                  f"{recall_at_k(found, truth):>9.3f} {np.percentile(lat, 50):>8.3f}")
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [20000, 100000]
+    for n in sizes:
+        run(n)
+        run_compression(n)
+
+
+if __name__ == "__main__":
+    main()
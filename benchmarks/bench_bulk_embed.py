@@ -0,0 +1,39 @@
+# benchmarks/bench_bulk_embed.py
+"""
+Chunks/sec for single-process encoding vs. utils.bulk_embed.encode_bulk.
+
+    python -m benchmarks.bench_bulk_embed [n_chunks]
+"""
+import sys
+import time
+
+from benchmarks.bench_chunking import make_text
+from utils.embed import semantic_chunks
+from utils.embed_service import get_embedding_service
+from utils.bulk_embed import encode_bulk
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    chunks = []
+    seed = 0
+    while len(chunks) < n:
+        chunks.extend(semantic_chunks(make_text(1024 * 1024, seed=seed), max_words=200))
+        seed += 1
+    chunks = chunks[:n]
+
+    service = get_embedding_service()
+    service.encode(chunks[:8])  # load the model outside the timing
+    start = time.perf_counter()
+    service.model.encode(chunks, convert_to_numpy=True)
+    sec = time.perf_counter() - start
+    print(f"{'single process, default batch':>36}: {n / sec:8.1f} chunks/sec")
+
+    for workers, threads, batch in ((2, 2, 32), (2, 2, 64), (4, 1, 64), (4, 2, 128)):
+        _, stats = encode_bulk(chunks, workers=workers, batch_size=batch, threads_per_worker=threads)
+        label = f"{workers} workers x {threads} threads, bs={batch}"
+        print(f"{label:>36}: {stats['chunks_per_sec']:8.1f} chunks/sec (incl. worker start-up)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_chunking.py
+"""
+Chunking throughput on synthetic multi-megabyte text.
+
+    python -m benchmarks.bench_chunking
+
+Prints seconds and MB/s per input size for semantic_chunks and for the
+previous quadratic implementation (skipped above 2 MB, where it takes minutes).
+"""
+import random
+import re
+import time
+
+from utils.embed import semantic_chunks
+
+WORDS = "the of and to in is was for on that with as by at from energy cell model data theorem".split()
+
+
+def legacy_semantic_chunks(text, max_words=450):
+    """The original implementation, kept here only as a baseline."""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks, current = [], ""
+    for s in sentences:
+        if len((current + " " + s).split()) <= max_words:
+            current = (current + " " + s).strip()
+        else:
+            if current:
+                chunks.append(current.strip())
+            current = s
+    if current:
+        chunks.append(current.strip())
+    return chunks
+
+
+def make_text(n_bytes, seed=0):
+    rng = random.Random(seed)
+    out, size = [], 0
+    while size < n_bytes:
+        s = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))).capitalize() + "."
+        out.append(s)
+        size += len(s) + 1
+    return " ".join(out)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    print(f"{'size':>8} {'impl':>10} {'chunks':>8} {'sec':>8} {'MB/s':>8}")
+    for mb in (0.5, 1, 2, 4, 8):
+        text = make_text(int(mb * 1024 * 1024))
+        sec, chunks = timed(semantic_chunks, text, max_words=450)
+        print(f"{mb:>6}MB {'linear':>10} {len(chunks):>8} {sec:>8.3f} {mb / sec:>8.1f}")
+        sec, chunks = timed(semantic_chunks, text, max_words=450, overlap_sentences=2)
+        print(f"{mb:>6}MB {'overlap=2':>10} {len(chunks):>8} {sec:>8.3f} {mb / sec:>8.1f}")
+        if mb <= 2:
+            sec, chunks = timed(legacy_semantic_chunks, text, max_words=450)
+            print(f"{mb:>6}MB {'legacy':>10} {len(chunks):>8} {sec:>8.3f} {mb / sec:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
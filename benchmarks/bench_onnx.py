@@ -0,0 +1,74 @@
+# benchmarks/bench_onnx.py
+"""
+Parity and throughput of the ONNX int8 backend vs. the PyTorch path.
+
+    python -m utils.onnx_backend all-MiniLM-L6-v2 models/minilm-onnx
+    python -m benchmarks.bench_onnx [n_chunks]
+
+Parity: cosine(torch, onnx) per text, and top-5 overlap of query->chunk
+rankings. Exits non-zero if the mean cosine drops below MIN_COSINE.
+"""
+import sys
+import time
+import numpy as np
+
+from benchmarks.bench_chunking import make_text
+from utils.embed import semantic_chunks
+from utils.embed_service import load_model
+
+MIN_COSINE = 0.98
+QUERIES = [
+    "What is the main theorem?",
+    "How is energy stored in the cell?",
+    "Define the data model used",
+    "Which model was used for the energy data?",
+]
+
+
+def normalize(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def throughput(model, texts, batch_size=32, repeat=2):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    chunks = semantic_chunks(make_text(2 * 1024 * 1024), max_words=120)[:n]
+
+    torch_model = load_model(backend="torch")
+    onnx_model = load_model(backend="onnx")
+
+    a = normalize(torch_model.encode(chunks, convert_to_numpy=True).astype("float32"))
+    b = normalize(onnx_model.encode(chunks))
+    cos = (a * b).sum(axis=1)
+    print(f"cosine(torch, onnx-int8) over {len(chunks)} chunks: mean={cos.mean():.4f} min={cos.min():.4f}")
+
+    qa = normalize(torch_model.encode(QUERIES, convert_to_numpy=True).astype("float32"))
+    qb = normalize(onnx_model.encode(QUERIES))
+    top_a = np.argsort(-(qa @ a.T), axis=1)[:, :5]
+    top_b = np.argsort(-(qb @ b.T), axis=1)[:, :5]
+    overlap = np.mean([len(set(x) & set(y)) / 5 for x, y in zip(top_a, top_b)])
+    score_err = np.abs((qa @ a.T) - (qb @ b.T)).max()
+    print(f"top-5 overlap: {overlap:.2f}  max |score diff|: {score_err:.4f}")
+
+    for label, model in (("torch", torch_model), ("onnx-int8", onnx_model)):
+        print(f"{label:>10} ingest: {throughput(model, chunks):8.1f} chunks/sec")
+        start = time.perf_counter()
+        for q in QUERIES * 25:
+            model.encode([q])
+        print(f"{label:>10} query:  {(time.perf_counter() - start) / (len(QUERIES) * 25) * 1000:8.2f} ms")
+
+    if cos.mean() < MIN_COSINE:
+        sys.exit(f"parity check failed: mean cosine {cos.mean():.4f} < {MIN_COSINE}")
+
+
+if __name__ == "__main__":
+    main()
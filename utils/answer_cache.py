@@ -0,0 +1,100 @@
+# utils/answer_cache.py
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+from utils.notes_db import DB_PATH
+from utils.rag import embed_query
+
+# a stored answer is reused when a new question's embedding is at least this similar (cosine)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH)
+    # answers live next to chats and notes; keyed by corpus fingerprint and model
+    conn.execute("""CREATE TABLE IF NOT EXISTS answer_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    corpus TEXT,
+                    model TEXT,
+                    question TEXT,
+                    vector BLOB,
+                    answer TEXT,
+                    sources TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS answer_cache_key ON answer_cache (corpus, model)")
+    return conn
+
+
+def _question_vector(question):
+    vec = np.asarray(embed_query(question), dtype="float32").reshape(-1)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def lookup_answer(question, corpus, model, threshold=None):
+    """
+    Return the stored answer_with_context() result for the most similar
+    earlier question on the same corpus and model, or None. The result gets
+    "cached_question" and "similarity" added.
+    """
+    threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+    now = time.time()
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT id, question, vector, answer, sources FROM answer_cache "
+              "WHERE corpus=? AND model=? AND created_at>=?", (corpus, model, now - ANSWER_CACHE_TTL))
+    rows = c.fetchall()
+    if not rows:
+        conn.close()
+        return None
+    vec = _question_vector(question)
+    sims = np.stack([np.frombuffer(r[2], dtype="float32") for r in rows]) @ vec
+    best = int(np.argmax(sims))
+    if sims[best] < threshold:
+        conn.close()
+        return None
+    row_id, cached_question, _, answer, sources = rows[best]
+    c.execute("UPDATE answer_cache SET last_used=? WHERE id=?", (now, row_id))
+    conn.commit()
+    conn.close()
+    return {
+        "answer": answer,
+        "used_chunks": json.loads(sources),
+        "cached_question": cached_question,
+        "similarity": float(sims[best]),
+    }
+
+
+def store_answer(question, corpus, model, result):
+    """Save an answer_with_context() result, then drop expired and least recently used entries."""
+    now = time.time()
+    vec = _question_vector(question)
+    # numpy scalars in hit dicts are not JSON serializable
+    sources = json.dumps(result.get("used_chunks", []), default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("INSERT INTO answer_cache (corpus, model, question, vector, answer, sources, created_at, last_used) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (corpus, model, question, vec.tobytes(), result["answer"], sources, now, now))
+    c.execute("DELETE FROM answer_cache WHERE created_at<?", (now - ANSWER_CACHE_TTL,))
+    c.execute("DELETE FROM answer_cache WHERE id NOT IN "
+              "(SELECT id FROM answer_cache ORDER BY last_used DESC LIMIT ?)", (ANSWER_CACHE_MAX_ENTRIES,))
+    conn.commit()
+    conn.close()
+
+
+def clear_answers(corpus=None):
+    conn = _connect()
+    if corpus is None:
+        conn.execute("DELETE FROM answer_cache")
+    else:
+        conn.execute("DELETE FROM answer_cache WHERE corpus=?", (corpus,))
+    conn.commit()
+    conn.close()
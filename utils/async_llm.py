@@ -0,0 +1,150 @@
+# utils/async_llm.py
+"""
+Async provider API. Calls go through one pooled async HTTP client per
+provider and a per-provider semaphore, so many summary / flashcard / Q&A
+jobs can be awaited together (asyncio.gather) without a thread per request.
+Deterministic responses go through the persistent cache in utils.llm_cache;
+its SQLite work runs in a worker thread so it never blocks the loop.
+
+Sync code uses run_sync(coro), which runs the coroutine on a shared
+background event loop; the blocking functions in utils.llm and
+utils.flashcards are thin wrappers around it.
+"""
+import asyncio
+import json
+import os
+import threading
+import weakref
+import httpx
+from groq import AsyncGroq
+
+from utils.llm_cache import cacheable, get_response, put_response
+from utils.clients import LLM_POOL_SIZE, LLM_KEEPALIVE_EXPIRY, LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_MAX_RETRIES
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+
+# requests in flight per provider; further calls wait on the semaphore
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "2"))
+# upper bound on one call, including time spent waiting for a slot
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "180"))
+
+# clients and semaphores belong to the loop they were created on
+_per_loop = weakref.WeakKeyDictionary()
+
+_bg_loop = None
+_bg_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+
+
+def _timeout():
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _state():
+    loop = asyncio.get_running_loop()
+    state = _per_loop.get(loop)
+    if state is None:
+        state = {
+            "groq": None,
+            "ollama": httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            "groq_sem": asyncio.Semaphore(GROQ_CONCURRENCY),
+            "ollama_sem": asyncio.Semaphore(OLLAMA_CONCURRENCY),
+        }
+        _per_loop[loop] = state
+    return state
+
+
+def get_async_groq_client():
+    """AsyncGroq on a pooled httpx.AsyncClient, one per event loop. Call from inside a coroutine."""
+    state = _state()
+    if state["groq"] is None:
+        state["groq"] = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=LLM_MAX_RETRIES,
+                                  http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()))
+    return state["groq"]
+
+
+async def agroq_chat(prompt, model="llama-3.1-8b-instant", temperature=0.7, max_tokens=2048, system=None):
+    use_cache = cacheable(temperature)
+    if use_cache:
+        cached = await asyncio.to_thread(get_response, "groq", model, temperature, prompt,
+                                         max_tokens=max_tokens, system=system)
+        if cached is not None:
+            return cached
+    state = _state()
+    client = get_async_groq_client()
+    messages = [{"role": "system", "content": system}] if system else []
+
+    async def call():
+        async with state["groq_sem"]:
+            res = await client.chat.completions.create(
+                model=model,
+                messages=messages + [{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        return res.choices[0].message.content
+
+    response = await asyncio.wait_for(call(), LLM_REQUEST_TIMEOUT)
+    if use_cache:
+        await asyncio.to_thread(put_response, "groq", model, temperature, prompt, response,
+                                max_tokens=max_tokens, system=system)
+    return response
+
+
+async def aollama_chat(prompt, model="llama2", temperature=0.2, max_tokens=1024, system=None, url=None):
+    """POST /api/generate without streaming; raises on HTTP or timeout errors."""
+    use_cache = cacheable(temperature)
+    if use_cache:
+        cached = await asyncio.to_thread(get_response, "ollama", model, temperature, prompt,
+                                         max_tokens=max_tokens, system=system)
+        if cached is not None:
+            return cached
+    state = _state()
+    payload = {"model": model, "prompt": prompt, "stream": False, "temperature": temperature, "max_tokens": max_tokens}
+    if system:
+        payload["system"] = system
+
+    async def call():
+        async with state["ollama_sem"]:
+            r = await state["ollama"].post(f"{url or OLLAMA_URL}/api/generate", json=payload)
+        r.raise_for_status()
+        data = r.json()
+        # The response format may differ across versions; adapt if needed.
+        if isinstance(data, dict) and "text" in data:
+            return data["text"]
+        return data.get("response") or json.dumps(data)
+
+    response = await asyncio.wait_for(call(), LLM_REQUEST_TIMEOUT)
+    if use_cache:
+        await asyncio.to_thread(put_response, "ollama", model, temperature, prompt, response,
+                                max_tokens=max_tokens, system=system)
+    return response
+
+
+async def achat(prompt, llm="groq", model=None, temperature=0.2, max_tokens=2048, system=None):
+    """Provider dispatch used by the higher-level async helpers."""
+    if llm == "ollama":
+        return await aollama_chat(prompt, model=model or "llama2", temperature=temperature,
+                                  max_tokens=max_tokens, system=system)
+    return await agroq_chat(prompt, model=model or "llama-3.1-8b-instant", temperature=temperature,
+                            max_tokens=max_tokens, system=system)
+
+
+def _background_loop():
+    global _bg_loop
+    with _bg_lock:
+        if _bg_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-llm", daemon=True).start()
+            _bg_loop = loop
+        return _bg_loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared background loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
@@ -0,0 +1,152 @@
+# utils/bm25.py
+import re
+import numpy as np
+
+# keep course codes, formula names and numbers intact: "CS101", "H2O", "e=mc2" -> e, mc2
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+_EMPTY = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32"))
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+class _Postings:
+    """
+    CSR postings of one batch of chunks: for term t, rows[indptr[t]:indptr[t+1]]
+    are the chunk rows containing it and tfs[...] the term frequencies. Rows
+    map back to caller ids through self.ids (chunk positions by default).
+    """
+
+    def __init__(self, chunks, ids=None):
+        self.ids = np.arange(len(chunks), dtype="int64") if ids is None else np.asarray(ids, dtype="int64")
+        self.vocab = {}
+        term_ids, rows, tfs = [], [], []
+        self.lengths = np.zeros(len(chunks), dtype="float32")
+        for row, text in enumerate(chunks):
+            tokens = tokenize(text)
+            self.lengths[row] = len(tokens)
+            counts = {}
+            for tok in tokens:
+                tid = self.vocab.setdefault(tok, len(self.vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            term_ids.extend(counts.keys())
+            rows.extend([row] * len(counts))
+            tfs.extend(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype="int64")
+        order = np.argsort(term_ids, kind="stable")
+        self.rows = np.asarray(rows, dtype="int32")[order]
+        self.tfs = np.asarray(tfs, dtype="float32")[order]
+        self.df = np.bincount(term_ids, minlength=len(self.vocab))
+        self.indptr = np.concatenate([[0], np.cumsum(self.df)]).astype("int64")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _postings(self, tids):
+        """(rows, tfs, postings per term) of the given term ids, concatenated."""
+        spans = [np.arange(self.indptr[t], self.indptr[t + 1]) for t in tids]
+        idx = np.concatenate(spans)
+        return self.rows[idx], self.tfs[idx], [len(s) for s in spans]
+
+
+def _top(ids, s, top_k):
+    # best top_k rows with a positive score, best first
+    k = min(top_k, int((s > 0).sum()))
+    if k == 0:
+        return _EMPTY
+    top = np.argpartition(-s, k - 1)[:k]
+    top = top[np.argsort(-s[top])]
+    return ids[top], s[top]
+
+
+class BM25Index(_Postings):
+    """
+    Compact inverted index with Okapi BM25 scoring.
+
+    Postings are stored CSR-style (see _Postings), so a query is scored
+    with a few array slices and one np.bincount.
+    """
+
+    def __init__(self, chunks, ids=None, k1=1.5, b=0.75):
+        super().__init__(chunks, ids)
+        self.k1, self.b = k1, b
+        n = max(len(chunks), 1)
+        self.idf = np.log1p((n - self.df + 0.5) / (self.df + 0.5)).astype("float32")
+        avgdl = self.lengths.mean() if len(chunks) else 1.0
+        # per-row length normalization, precomputed once
+        self.norm = (k1 * (1 - b + b * self.lengths / max(avgdl, 1e-9))).astype("float32")
+
+    def scores(self, query):
+        """BM25 score of every row for query (float32 array, zeros where no term matches)."""
+        tids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not tids:
+            return np.zeros(len(self.ids), dtype="float32")
+        rows, tf, counts = self._postings(tids)
+        idf = np.repeat(self.idf[tids], counts)
+        contrib = idf * tf * (self.k1 + 1) / (tf + self.norm[rows])
+        return np.bincount(rows, weights=contrib, minlength=len(self.ids)).astype("float32")
+
+    def search(self, query, top_k=5):
+        """Return (ids, scores) of the best top_k rows with a positive score, best first."""
+        return _top(self.ids, self.scores(query), top_k)
+
+
+class SegmentedBM25:
+    """
+    BM25 over segments that are added and dropped independently, e.g. one
+    per Corpus.add_document call grouped under its doc_id, so a change only
+    tokenizes the new chunks. Document frequencies, the number of rows and
+    the average length are summed over the live segments at query time,
+    which gives the same scores as one BM25Index over all of them.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1, self.b = k1, b
+        self._segments = {}  # key -> list of _Postings
+
+    def add(self, key, chunks, ids):
+        self._segments.setdefault(key, []).append(_Postings(chunks, ids))
+
+    def remove(self, key):
+        self._segments.pop(key, None)
+
+    def __len__(self):
+        return sum(len(s) for group in self._segments.values() for s in group)
+
+    def search(self, query, top_k=5):
+        """Return (ids, scores) of the best top_k rows with a positive score, best first."""
+        segments = [s for group in self._segments.values() for s in group]
+        n = sum(len(s) for s in segments)
+        terms = set(tokenize(query))
+        if not n or not terms:
+            return _EMPTY
+        df = dict.fromkeys(terms, 0)
+        for s in segments:
+            for t in terms:
+                if t in s.vocab:
+                    df[t] += s.df[s.vocab[t]]
+        idf = {t: np.log1p((n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        avgdl = max(sum(float(s.lengths.sum()) for s in segments) / n, 1e-9)
+
+        ids, scores = [], []
+        for s in segments:
+            matched = [t for t in terms if t in s.vocab]
+            if not matched:
+                continue
+            rows, tf, counts = s._postings([s.vocab[t] for t in matched])
+            norm = self.k1 * (1 - self.b + self.b * s.lengths[rows] / avgdl)
+            contrib = np.repeat([idf[t] for t in matched], counts) * tf * (self.k1 + 1) / (tf + norm)
+            seg_scores = np.bincount(rows, weights=contrib, minlength=len(s))
+            hit = np.flatnonzero(seg_scores > 0)
+            ids.append(s.ids[hit])
+            scores.append(seg_scores[hit].astype("float32"))
+        if not ids:
+            return _EMPTY
+        return _top(np.concatenate(ids), np.concatenate(scores), top_k)
+
+
+def build_bm25_index(chunks, ids=None):
+    return BM25Index(chunks, ids=ids)
@@ -0,0 +1,154 @@
+# utils/bulk_embed.py
+"""
+Multi-process encoding for large ingests / backfills.
+
+    python -m utils.bulk_embed notes/*.pdf --workers 4 --threads 2
+
+extracts, chunks and encodes the given PDFs, fills the embedding cache and
+the document library (utils.library), and prints chunks/sec.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from utils.embed_service import EMBED_MODEL_NAME, EMBED_BACKEND, load_model, get_embedding_service
+
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "64"))
+BULK_THREADS_PER_WORKER = int(os.getenv("BULK_THREADS_PER_WORKER", "2"))
+# texts handed to a worker per task; a few batches so work stays balanced
+BULK_SHARD_BATCHES = int(os.getenv("BULK_SHARD_BATCHES", "8"))
+
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    if EMBED_BACKEND == "onnx":
+        from utils.onnx_backend import OnnxEncoder, ONNX_MODEL_DIR, exported_model_name
+        exported = exported_model_name()
+        if exported is not None and exported != model_name:
+            raise ValueError(f"ONNX_MODEL_DIR={ONNX_MODEL_DIR} holds {exported}, not {model_name}")
+        _worker_model = OnnxEncoder(threads=threads)
+        return
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name)
+
+
+def _encode_shard(args):
+    texts, batch_size = args
+    return _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+
+
+def encode_bulk(texts, workers=None, batch_size=None, threads_per_worker=None, model_name=EMBED_MODEL_NAME):
+    """
+    Encode texts across a pool of CPU worker processes, each loading its own
+    model and limited to threads_per_worker torch threads; a single worker
+    or shard is encoded in-process by the shared embedding service. Texts
+    are sorted by length so every batch pads to similar lengths, then
+    restored to input order. Returns (embeddings, stats) where stats
+    includes chunks_per_sec.
+    """
+    workers = workers or BULK_WORKERS
+    batch_size = batch_size or BULK_BATCH_SIZE
+    threads = threads_per_worker or BULK_THREADS_PER_WORKER
+    texts = list(texts)
+    start = time.perf_counter()
+
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    shard = batch_size * BULK_SHARD_BATCHES
+    shards = [(sorted_texts[i:i + shard], batch_size) for i in range(0, len(sorted_texts), shard)]
+
+    if not shards:
+        emb = np.zeros((0, 0), dtype="float32")
+    elif workers <= 1 or len(shards) == 1:
+        # in-process: reuse the shared model and leave the process's torch threads alone
+        if model_name == EMBED_MODEL_NAME:
+            encode = get_embedding_service().encode
+        else:
+            encode = load_model(model_name).encode
+        emb = np.vstack([np.asarray(encode(texts, batch_size=bs), dtype="float32") for texts, bs in shards])
+    else:
+        # spawn: forking a process that already holds torch threads can deadlock
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards)), mp_context=ctx,
+                                 initializer=_init_worker, initargs=(model_name, threads)) as pool:
+            emb = np.vstack(list(pool.map(_encode_shard, shards)))
+
+    if len(texts):
+        out = np.empty_like(emb)
+        out[order] = emb
+        emb = out
+    seconds = time.perf_counter() - start
+    stats = {
+        "chunks": len(texts),
+        "seconds": seconds,
+        "chunks_per_sec": len(texts) / seconds if seconds else 0.0,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "batch_size": batch_size,
+    }
+    return emb, stats
+
+
+def main():
+    from utils.extract import extract_pages_many, pdf_digest
+    from utils.preprocess import join_pages
+    from utils.embed import semantic_chunk_spans, encode_chunks
+    from utils.library import corpus_id, save_entry
+    from utils.corpus import Corpus
+    import faiss
+
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into the embedding cache and document library.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=BULK_THREADS_PER_WORKER)
+    parser.add_argument("--max-words", type=int, default=450)
+    args = parser.parse_args()
+
+    datas = []
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            datas.append(f.read())
+    per_file = []  # (chunks, spans, pages) per PDF
+    texts = []
+    for pages in extract_pages_many(datas):
+        text, page_starts, page_numbers = join_pages(pages)
+        texts.append(text)
+        per_file.append(semantic_chunk_spans(text, max_words=args.max_words,
+                                             page_starts=page_starts, page_numbers=page_numbers))
+
+    def encoder(texts):
+        emb, stats = encode_bulk(texts, args.workers, args.batch_size, args.threads)
+        print(f"encoded {stats['chunks']} chunks in {stats['seconds']:.1f}s "
+              f"({stats['chunks_per_sec']:.1f} chunks/sec, {stats['workers']} workers x {stats['threads_per_worker']} threads)")
+        return emb
+
+    model_key = get_embedding_service().cache_key
+    # one pass over all new chunks so the pool is started once
+    all_chunks = [c for chunks, _, _ in per_file for c in chunks]
+    emb = encode_chunks(all_chunks, encoder=encoder)
+    faiss.normalize_L2(emb)
+
+    offset = 0
+    for path, data, text, (chunks, spans, pages) in zip(args.pdfs, datas, texts, per_file):
+        part = emb[offset:offset + len(chunks)]
+        offset += len(chunks)
+        if not chunks:
+            continue
+        prov = np.zeros(len(chunks), dtype=Corpus.PROVENANCE_DTYPE)
+        prov["page"] = [-1 if p is None else p for p in pages]
+        prov["start"], prov["end"] = np.asarray(spans, dtype="int64").T
+        doc_id = corpus_id([pdf_digest(data)], args.max_words, model_key)
+        save_entry(doc_id, embeddings=part, provenance=prov, text=text,
+                   files=[os.path.basename(path)], max_words=args.max_words, model=model_key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# utils/chunk_store.py
+import numpy as np
+
+
+class ChunkStore:
+    """
+    Sequence of chunk strings backed by one text buffer per document.
+
+    Each chunk is a row of a structured array (buffer, page, start, end);
+    the string is sliced out of its buffer only when it is accessed, so the
+    text of a document is held once however many chunks point into it.
+    Chunks added without a buffer span are kept as plain strings and
+    flagged with start = end = -1. Released buffers read back as None.
+    """
+
+    TABLE_DTYPE = np.dtype([("file", "i4"), ("page", "i4"), ("start", "i8"), ("end", "i8")])
+
+    def __init__(self):
+        self._table = np.zeros(0, dtype=self.TABLE_DTYPE)
+        self._n = 0
+        self._buffers = []  # per buffer: list of text parts, joined lazily; None once released
+        self._loose = {}    # chunk id -> string for chunks without a span
+
+    @property
+    def table(self):
+        return self._table[:self._n]
+
+    def new_buffer(self, text=""):
+        self._buffers.append([text] if text else [])
+        return len(self._buffers) - 1
+
+    def extend_buffer(self, buf, text):
+        """Append text to a buffer (newline-separated, as utils.preprocess.join_pages does); returns its offset."""
+        parts = self._buffers[buf]
+        offset = sum(len(p) for p in parts)
+        if parts:
+            parts.append("\n")
+            offset += 1
+        parts.append(text)
+        return offset
+
+    def buffer_text(self, buf):
+        parts = self._buffers[buf]
+        if parts is None:
+            return None
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+    def release_buffer(self, buf):
+        """Drop a document's text and any loose chunk strings that belonged to it."""
+        self._buffers[buf] = None
+        for i in np.flatnonzero(self.table["file"] == buf):
+            self._loose.pop(int(i), None)
+
+    def append(self, buf, chunks, spans=None, pages=None):
+        """
+        Add chunks of buffer buf and return their ids. A chunk whose span
+        slices exactly its string out of the buffer is stored as offsets
+        only; any other chunk keeps its string. chunks=None stores the spans
+        alone, e.g. for a document reloaded from utils.library with its
+        text; they must fit the buffer.
+        """
+        n = len(spans) if chunks is None else len(chunks)
+        text = self.buffer_text(buf) if spans is not None else None
+        spans = np.asarray(spans, dtype="int64").reshape(-1, 2) if spans is not None else None
+        if text and len(spans) == n:
+            fits = (spans[:, 0] >= 0) & (spans[:, 0] <= spans[:, 1]) & (spans[:, 1] <= len(text))
+            if chunks is not None:
+                fits &= [ok and text[a:b] == c for ok, (a, b), c in zip(fits, spans, chunks)]
+        else:
+            fits = np.zeros(n, dtype=bool)
+        if chunks is None and not fits.all():
+            raise ValueError("chunks=None needs spans inside the buffer text")
+
+        self._grow(self._n + n)
+        ids = np.arange(self._n, self._n + n, dtype="int64")
+        rows = self._table[self._n:self._n + n]
+        rows["file"] = buf
+        rows["page"] = [-1 if p is None else p for p in pages] if pages is not None else -1
+        rows["start"], rows["end"] = -1, -1
+        if fits.any():
+            rows["start"][fits], rows["end"][fits] = spans[fits].T
+        for i in np.flatnonzero(~fits):
+            self._loose[int(ids[i])] = chunks[i]
+        self._n += n
+        return ids
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0 or i >= self._n:
+            raise IndexError(i)
+        row = self._table[i]
+        if row["start"] < 0:
+            return self._loose.get(i)
+        text = self.buffer_text(int(row["file"]))
+        return None if text is None else text[row["start"]:row["end"]]
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def _grow(self, n):
+        if n > len(self._table):
+            table = np.zeros(max(n, 2 * len(self._table), 1024), dtype=self.TABLE_DTYPE)
+            table[:self._n] = self._table[:self._n]
+            self._table = table
@@ -0,0 +1,62 @@
+# utils/clients.py
+import os
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from groq import Groq
+
+# shared provider clients: one pooled keep-alive connection set per process instead of one per call
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # seconds an idle connection is kept
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+_lock = threading.Lock()
+_groq_client = None
+_ollama_session = None
+
+
+def request_timeout():
+    """(connect, read) timeout for requests calls to Ollama."""
+    return (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+
+
+def get_groq_client():
+    """Process-wide Groq client on a pooled httpx.Client (reads GROQ_API_KEY on first use)."""
+    global _groq_client
+    with _lock:
+        if _groq_client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE,
+                                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+            _groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client,
+                                max_retries=LLM_MAX_RETRIES)
+        return _groq_client
+
+
+def get_ollama_session():
+    """Process-wide requests.Session whose adapter keeps up to LLM_POOL_SIZE connections alive per host."""
+    global _ollama_session
+    with _lock:
+        if _ollama_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=LLM_POOL_SIZE, pool_maxsize=LLM_POOL_SIZE,
+                                  max_retries=LLM_MAX_RETRIES)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _ollama_session = session
+        return _ollama_session
+
+
+def close_clients():
+    global _groq_client, _ollama_session
+    with _lock:
+        if _groq_client is not None:
+            _groq_client.close()
+        if _ollama_session is not None:
+            _ollama_session.close()
+        _groq_client, _ollama_session = None, None
@@ -0,0 +1,84 @@
+# utils/context.py
+import os
+import numpy as np
+
+from utils.bm25 import tokenize
+from utils.preprocess import split_sentences
+
+# prompt context assembly: token budget, MMR relevance/diversity trade-off, duplicate cut-off
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.92"))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English)."""
+    return max(1, len(text) // 4)
+
+
+def mmr_select(retrieved, embeddings, lambda_=MMR_LAMBDA, dup_threshold=DUPLICATE_THRESHOLD):
+    """
+    Re-order retrieve() hits by maximal marginal relevance using the chunk
+    vectors already in embeddings (indexed by hit["index"]), dropping hits
+    whose cosine to an already selected one exceeds dup_threshold.
+    """
+    if len(retrieved) <= 1 or embeddings is None or len(embeddings) == 0:
+        return list(retrieved)
+    vecs = np.asarray(embeddings[[r["index"] for r in retrieved]], dtype="float32")
+    vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+    sim = vecs @ vecs.T
+    rel = np.array([r.get("norm_score", r["score"]) for r in retrieved], dtype="float32")
+
+    selected = [int(np.argmax(rel))]
+    remaining = np.ones(len(retrieved), dtype=bool)
+    remaining[selected[0]] = False
+    while remaining.any():
+        redundancy = sim[:, selected].max(axis=1)
+        remaining &= redundancy < dup_threshold
+        if not remaining.any():
+            break
+        mmr = np.where(remaining, lambda_ * rel - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        remaining[best] = False
+    return [retrieved[i] for i in selected]
+
+
+def trim_to_budget(query, hits, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Keep the sentences most relevant to query until token_budget is used.
+    A sentence scores by query-term overlap plus a prior from its chunk's
+    rank; kept sentences stay in their original order within each chunk.
+    """
+    q_terms = set(tokenize(query))
+    candidates = []  # (score, hit position, sentence position, sentence)
+    for h, hit in enumerate(hits):
+        prior = 1.0 / (h + 1)
+        for j, sent in enumerate(split_sentences(hit["chunk"])):
+            terms = set(tokenize(sent))
+            overlap = len(q_terms & terms) / (len(q_terms) or 1)
+            candidates.append((overlap + 0.5 * prior, h, j, sent))
+
+    kept, used = set(), 0
+    for score, h, j, sent in sorted(candidates, key=lambda c: c[0], reverse=True):
+        cost = estimate_tokens(sent)
+        if used + cost > token_budget:
+            continue
+        kept.add((h, j))
+        used += cost
+
+    packed = []
+    for h, hit in enumerate(hits):
+        sents = [c[3] for c in candidates if c[1] == h and (h, c[2]) in kept]
+        if sents:
+            packed.append(dict(hit, chunk=" ".join(sents)))
+    return packed
+
+
+def pack_context(query, retrieved, embeddings, token_budget=CONTEXT_TOKEN_BUDGET,
+                 lambda_=MMR_LAMBDA, dup_threshold=DUPLICATE_THRESHOLD):
+    """retrieve() hits -> de-duplicated, diversity-ordered hits trimmed to token_budget."""
+    hits = mmr_select(retrieved, embeddings, lambda_=lambda_, dup_threshold=dup_threshold)
+    if sum(estimate_tokens(h["chunk"]) for h in hits) <= token_budget:
+        return hits
+    return trim_to_budget(query, hits, token_budget)
@@ -0,0 +1,253 @@
+# utils/corpus.py
+import os
+import numpy as np
+import faiss
+
+from utils.embed import encode_chunks, make_index, resolve_kind, index_codec, EMBED_STORE_DTYPE
+from utils.bm25 import SegmentedBM25
+from utils.chunk_store import ChunkStore
+
+# trained indexes (SQ8 / PQ ranges, IVF centroids) are retrained once the corpus grows this much past their training set
+RETRAIN_GROWTH = float(os.getenv("CORPUS_RETRAIN_GROWTH", "2"))
+
+
+class EmbeddingStore:
+    """
+    Row-addressable vectors kept as one block per add_document call, so a
+    block can be a memory-mapped library array (shared by every session)
+    and removing a document frees its rows. Indexing with a chunk id or an
+    array of ids returns float32 rows; rows of removed documents read as 0.
+    """
+
+    def __init__(self):
+        self._starts = []  # first chunk id of each block
+        self._blocks = []  # (doc_id, array) or None once released
+        self._n = 0
+        self.dim = 0
+
+    def append(self, doc_id, block):
+        self._starts.append(self._n)
+        self._blocks.append((doc_id, block))
+        self._n += len(block)
+        self.dim = block.shape[1]
+
+    def release(self, doc_id):
+        self._blocks = [None if b is not None and b[0] == doc_id else b for b in self._blocks]
+
+    @property
+    def shape(self):
+        return (self._n, self.dim)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, ids):
+        if np.isscalar(ids):
+            return self[np.array([ids])][0]
+        ids = np.asarray(ids, dtype="int64")
+        out = np.zeros((len(ids), self.dim), dtype="float32")
+        blocks = np.searchsorted(self._starts, ids, side="right") - 1
+        for b in np.unique(blocks):
+            if self._blocks[b] is None:
+                continue
+            sel = blocks == b
+            out[sel] = self._blocks[b][1][ids[sel] - self._starts[b]]
+        return out
+
+
+class Corpus:
+    """
+    Incrementally maintained index over several documents.
+
+    Every chunk gets a permanent int64 id equal to its row in the chunk store
+    and embedding store, and is stored in an IndexIDMap2 under that id, so
+    retrieve(query, corpus.index, corpus.embeddings, corpus.chunks) works as
+    with a plain index. Adding a document only encodes and appends its own
+    chunks; removing one deletes its ids and releases its text.
+
+    Chunks live in a ChunkStore: one cleaned text buffer per document (file)
+    plus a structured array with the file, page (1-based, -1 if unknown) and
+    [start, end) span of every chunk, which doubles as the provenance table.
+
+    Vectors are kept in store_dtype (EMBED_STORE_DTYPE) outside the index,
+    or as the caller's array when it is already float16/float32, e.g. a
+    memory-mapped library entry; only the index itself is per session.
+    """
+
+    PROVENANCE_DTYPE = ChunkStore.TABLE_DTYPE
+
+    def __init__(self, kind="auto", compression="none", store_dtype=EMBED_STORE_DTYPE):
+        self.kind = kind
+        self.compression = compression
+        self.store_dtype = store_dtype
+        self.index = None
+        self.chunks = ChunkStore()
+        self.doc_ids = {}   # doc_id -> np.ndarray of chunk ids
+        self.doc_names = {}
+        self.complete = set()  # doc_ids whose ingestion finished; see mark_complete
+        self.version = 0
+        self._emb = EmbeddingStore()
+        self._layout = None  # (kind, codec) the current index was built with
+        self._trained_on = 0  # vectors the current index was trained on
+        self._bm25 = SegmentedBM25()
+        self.files = []     # file name per file id (= chunk store buffer)
+        self.file_docs = []  # doc_id per file id
+        self._file_ids = {}  # doc_id -> file id
+
+    @property
+    def embeddings(self):
+        return self._emb
+
+    @property
+    def bm25(self):
+        """Sparse BM25 index over the live chunks; postings are added and dropped per document."""
+        return self._bm25
+
+    @property
+    def provenance_table(self):
+        return self.chunks.table
+
+    def full_text(self, doc_ids=None):
+        """Cleaned text of the given (default: all live) documents, newline separated."""
+        texts = []
+        for doc_id in self.documents() if doc_ids is None else doc_ids:
+            if doc_id not in self.doc_ids:
+                continue
+            # documents added without their text fall back to their chunks
+            text = self.chunks.buffer_text(self._file_ids[doc_id])
+            texts.append(text or " ".join(self.chunks[i] for i in self.doc_ids[doc_id]))
+        return "\n".join(t for t in texts if t)
+
+    def append_text(self, doc_id, text, name=None):
+        """Stream more cleaned page text into doc_id's buffer; returns the offset it starts at."""
+        return self.chunks.extend_buffer(self._file_id(doc_id, name), text)
+
+    def provenance(self, chunk_id):
+        """Source metadata of one chunk: file, doc_id, page (or None), start, end."""
+        rec = self.chunks.table[chunk_id]
+        file_id = int(rec["file"])
+        return {
+            "file": self.files[file_id] if file_id >= 0 else None,
+            "doc_id": self.file_docs[file_id] if file_id >= 0 else None,
+            "page": int(rec["page"]) if rec["page"] >= 0 else None,
+            "start": int(rec["start"]),
+            "end": int(rec["end"]),
+        }
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_ids
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.doc_ids.values())
+
+    def documents(self):
+        return list(self.doc_ids)
+
+    def mark_complete(self, doc_id):
+        """Record that every chunk of doc_id has been added (streamed documents arrive in batches)."""
+        self.complete.add(doc_id)
+
+    def incomplete(self):
+        """Documents with text or chunks whose ingestion never finished, e.g. interrupted by a rerun."""
+        started = list(dict.fromkeys(list(self._file_ids) + list(self.doc_ids)))
+        return [d for d in started if d not in self.complete]
+
+    def add_document(self, doc_id, chunks, embeddings=None, name=None, spans=None, pages=None, text=None):
+        """
+        Append chunks for doc_id (calling again for the same doc_id extends it).
+        embeddings, if given, must be normalized rows matching chunks;
+        otherwise the chunks are encoded (through the embedding cache).
+        spans / pages give each chunk's (start, end) offsets and start page,
+        as returned by semantic_chunk_spans. With the document text (here or
+        through append_text) only the offsets are kept, not the strings.
+        chunks=None takes the chunks to be text[start:end] of the spans, as
+        for a library entry; embeddings are then required.
+        """
+        file_id = self._file_id(doc_id, name)
+        if text is not None:
+            self.chunks.extend_buffer(file_id, text)
+        if chunks is None:
+            if embeddings is None:
+                raise ValueError("chunks=None needs the document's embeddings")
+        else:
+            chunks = list(chunks)
+        if not len(embeddings if chunks is None else chunks):
+            self.doc_ids.setdefault(doc_id, np.zeros(0, dtype="int64"))
+            return self.doc_ids[doc_id]
+        if embeddings is None:
+            embeddings = encode_chunks(chunks)
+            faiss.normalize_L2(embeddings)
+        if not isinstance(embeddings, np.ndarray) or embeddings.dtype not in (np.float16, np.float32):
+            embeddings = np.asarray(embeddings, dtype="float32")
+        # library arrays (possibly mmapped) are kept as they are; fresh vectors in the store dtype
+        stored = embeddings if isinstance(embeddings, np.memmap) else embeddings.astype(self.store_dtype, copy=False)
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+
+        ids = self.chunks.append(file_id, chunks, spans=spans, pages=pages)
+        self._emb.append(doc_id, stored)
+        self._bm25.add(doc_id, [self.chunks[i] for i in ids] if chunks is None else chunks, ids)
+        self.doc_ids[doc_id] = np.concatenate([self.doc_ids.get(doc_id, np.zeros(0, dtype="int64")), ids])
+        if name is not None:
+            self.doc_names[doc_id] = name
+
+        if self.index is None or self._target_layout() != self._layout or self._needs_retrain():
+            self._rebuild()
+        else:
+            self.index.add_with_ids(embeddings, ids)
+        self.version += 1
+        return ids
+
+    def remove_document(self, doc_id):
+        ids = self.doc_ids.pop(doc_id, None)
+        self.doc_names.pop(doc_id, None)
+        self.complete.discard(doc_id)
+        self._bm25.remove(doc_id)
+        if doc_id in self._file_ids:
+            # a re-added document gets a fresh buffer rather than the released one
+            self.chunks.release_buffer(self._file_ids.pop(doc_id))
+        if ids is None:
+            return
+        self._emb.release(doc_id)
+        if len(ids) and self.index is not None:
+            try:
+                self.index.remove_ids(ids)
+            except RuntimeError:
+                # e.g. HNSW cannot delete; rebuild from the stored vectors instead
+                self._rebuild()
+        if len(self) == 0:
+            self.index, self._layout = None, None
+        elif self._target_layout() != self._layout:
+            self._rebuild()
+        self.version += 1
+
+    def _file_id(self, doc_id, name=None):
+        if doc_id not in self._file_ids:
+            self._file_ids[doc_id] = self.chunks.new_buffer()
+            self.files.append(name or doc_id)
+            self.file_docs.append(doc_id)
+        return self._file_ids[doc_id]
+
+    def _live_ids(self):
+        if not self.doc_ids:
+            return np.zeros(0, dtype="int64")
+        return np.sort(np.concatenate(list(self.doc_ids.values())))
+
+    def _target_layout(self):
+        n = len(self)
+        return resolve_kind(n, self.kind), index_codec(self._emb.shape[1], n, self.compression)
+
+    def _needs_retrain(self):
+        # flat float32 / fp16 codes need no training; quantizer ranges and IVF centroids do
+        kind, codec = self._layout
+        trained = kind == "ivf" or codec.startswith(("SQ8", "PQ"))
+        return trained and len(self) > RETRAIN_GROWTH * self._trained_on
+
+    def _rebuild(self):
+        # removed documents are already released, so their rows are never gathered here
+        ids = self._live_ids()
+        if not len(ids):
+            self.index, self._layout = None, None
+            return
+        self._layout = self._target_layout()
+        self._trained_on = len(ids)
+        self.index = make_index(self._emb[ids], kind=self._layout[0], compression=self.compression, ids=ids)
@@ -1,34 +1,250 @@
 # utils/embed.py
+import bisect
+import math
+import os
 import re
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-
-# model for embeddings
-EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-embed_model = SentenceTransformer(EMBED_MODEL_NAME)
-
-def semantic_chunks(text, max_words=450):
-    """Create semantic chunks by sentence boundaries, not breaking sentences mid-way."""
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks, current = [], ""
-    for s in sentences:
-        if len((current + " " + s).split()) <= max_words:
-            current = (current + " " + s).strip()
-        else:
-            if current:
-                chunks.append(current.strip())
-            current = s
+from utils.preprocess import clean_text
+from utils.embed_cache import text_hash, get_embeddings, put_embeddings
+from utils.embed_service import EMBED_MODEL_NAME, get_embedding_service
+from utils.bm25 import build_bm25_index
+
+# corpus sizes at which build_faiss_index switches from exact search to ANN
+FLAT_MAX_CHUNKS = int(os.getenv("FLAT_MAX_CHUNKS", "20000"))
+HNSW_MAX_CHUNKS = int(os.getenv("HNSW_MAX_CHUNKS", "200000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+
+# vector compression inside the index (none / fp16 / sq8 / pq) and dtype of the returned embeddings
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none")
+EMBED_STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")
+PQ_M = int(os.getenv("PQ_M", "0"))
+PQ_MIN_TRAIN = int(os.getenv("PQ_MIN_TRAIN", "10000"))
+
+def __getattr__(name):
+    # embed_model is loaded on first access and shared with utils.rag
+    if name == "embed_model":
+        return get_embedding_service().model
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+
+def _sentence_spans(text):
+    """(start, end) of every non-blank sentence in text, without surrounding whitespace."""
+    spans, pos = [], 0
+    bounds = [(m.start(), m.end()) for m in _SENTENCE_SPLIT.finditer(text)] + [(len(text), len(text))]
+    for stop, nxt in bounds:
+        seg = text[pos:stop]
+        lead = len(seg) - len(seg.lstrip())
+        trail = len(seg) - len(seg.rstrip())
+        if stop - trail > pos + lead:
+            spans.append((pos + lead, stop - trail))
+        pos = nxt
+    return spans
+
+def _pack_sentences(sentences, max_words, overlap_sentences=0):
+    """
+    Greedy sentence packing shared by the batch and streaming chunkers.
+    sentences yields (text, start, end, page); yields (chunk, start, end, page)
+    where start/end span the chunk and page is where it begins.
+    """
+    current, counts, words = [], [], 0
+    for sent in sentences:
+        n = len(sent[0].split())
+        if not n:
+            continue
+        if current and words + n > max_words:
+            yield " ".join(c[0] for c in current), current[0][1], current[-1][2], current[0][3]
+            if overlap_sentences > 0:
+                current, counts = current[-overlap_sentences:], counts[-overlap_sentences:]
+                words = sum(counts)
+                while current and words + n > max_words:
+                    words -= counts.pop(0)
+                    current.pop(0)
+            else:
+                current, counts, words = [], [], 0
+        current.append(sent)
+        counts.append(n)
+        words += n
     if current:
-        chunks.append(current.strip())
-    return chunks
+        yield " ".join(c[0] for c in current), current[0][1], current[-1][2], current[0][3]
+
+def semantic_chunk_spans(text, max_words=450, overlap_sentences=0, page_starts=None, page_numbers=None):
+    """
+    semantic_chunks plus provenance: returns (chunks, spans, pages) where
+    spans[i] is the (start, end) character range of chunk i in text and
+    pages[i] the page it starts on (from page_starts / page_numbers as
+    returned by utils.preprocess.join_pages; None without them).
+    Here chunks[i] is exactly text[start:end], keeping the source whitespace
+    between sentences, so a chunk stored as offsets reads back as the same
+    string that was embedded and indexed.
+    """
+    starts = page_starts or [0]
+    numbers = page_numbers or [None]
+    sentences = ((text[a:b], a, b, numbers[bisect.bisect_right(starts, a) - 1]) for a, b in _sentence_spans(text))
+    chunks, spans, pages = [], [], []
+    for _, a, b, page in _pack_sentences(sentences, max_words, overlap_sentences):
+        chunks.append(text[a:b])
+        spans.append((a, b))
+        pages.append(page)
+    return chunks, spans, pages
+
+def semantic_chunks(text, max_words=450, overlap_sentences=0):
+    """
+    Create semantic chunks by sentence boundaries, not breaking sentences mid-way.
+    Word counts are kept per sentence so the cost is linear in the text length.
+    With overlap_sentences > 0 each chunk starts with up to that many trailing
+    sentences of the previous one (as many as still fit in max_words).
+    """
+    return semantic_chunk_spans(text, max_words, overlap_sentences)[0]
+
+def encode_chunks(chunks, use_cache=True, encoder=None):
+    """
+    Encode chunks to float32 vectors, reusing any vector already in the
+    persistent embedding cache so only unseen chunks go through the model.
+    encoder(texts) -> array replaces the shared service, e.g. for bulk ingests.
+    """
+    service = get_embedding_service()
+    encoder = encoder or service.encode
+    if not use_cache:
+        return encoder(chunks)
+    hashes = [text_hash(c) for c in chunks]
+    cached = get_embeddings(hashes, service.cache_key)
+    missing = list(dict.fromkeys(h for h in hashes if h not in cached))
+    if missing:
+        by_hash = dict(zip(hashes, chunks))
+        new = encoder([by_hash[h] for h in missing])
+        put_embeddings(missing, new, service.cache_key)
+        cached.update(zip(missing, new))
+    if not hashes:
+        return np.zeros((0, service.dimension()), dtype="float32")
+    return np.stack([cached[h] for h in hashes])
+
+def index_codec(dim, n, compression):
+    """Vector encoding part of the factory string; see index_spec."""
+    if compression in (None, "none"):
+        return "Flat"
+    if compression == "fp16":
+        return "SQfp16"
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        # PQ trains 256 centroids per sub-quantizer; too few points -> fall back to SQ8
+        if n < PQ_MIN_TRAIN:
+            return "SQ8"
+        m = PQ_M or dim // 4
+        while dim % m:
+            m -= 1
+        return f"PQ{m}"
+    raise ValueError(f"Unknown compression: {compression}")
 
-def build_faiss_index(chunks):
-    emb = embed_model.encode(chunks, convert_to_numpy=True)
-    emb = emb.astype("float32")
+def resolve_kind(n, kind="auto"):
+    """Concrete index kind for n vectors; see index_spec."""
+    if kind == "auto":
+        return "flat" if n <= FLAT_MAX_CHUNKS else "hnsw" if n <= HNSW_MAX_CHUNKS else "ivf"
+    return kind
+
+def index_spec(n, kind="auto", compression=None, dim=384):
+    """
+    faiss.index_factory string for n vectors. kind is "flat", "hnsw", "ivf" or
+    "auto": exact search up to FLAT_MAX_CHUNKS, HNSW up to HNSW_MAX_CHUNKS and
+    IVF beyond that, where HNSW's graph memory and build time stop paying off.
+    compression stores vectors as "fp16" (2x smaller), "sq8" (4x) or "pq"
+    (product quantization, 16x by default) instead of float32.
+    """
+    kind = resolve_kind(n, kind)
+    codec = index_codec(dim, n, compression)
+    if kind == "flat":
+        return codec
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M}" if codec == "Flat" else f"HNSW{HNSW_M},{codec}"
+    if kind == "ivf":
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        return f"IVF{nlist},{codec}"
+    raise ValueError(f"Unknown index kind: {kind}")
+
+def make_index(emb, kind="auto", compression=None, ids=None):
+    """
+    Create, train if needed, and fill an inner-product index for normalized
+    vectors. With ids the index is wrapped in IndexIDMap2 and vectors are
+    stored under those int64 ids instead of their row positions.
+    """
+    spec = index_spec(emb.shape[0], kind, compression, dim=emb.shape[1])
+    if ids is not None:
+        spec = "IDMap2," + spec
+    index = faiss.index_factory(emb.shape[1], spec, faiss.METRIC_INNER_PRODUCT)
+    base = faiss.downcast_index(index.index) if ids is not None else index
+    if hasattr(base, "hnsw"):
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(emb)
+    if ids is not None:
+        index.add_with_ids(emb, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(emb)
+    return index
+
+def build_faiss_index(chunks, kind="auto", compression=INDEX_COMPRESSION, store_dtype=EMBED_STORE_DTYPE, bulk=False):
+    """
+    Encode chunks and index them. Returns (index, embeddings, bm25):
+    embeddings are normalized and, with store_dtype="float16", kept at half
+    the memory; bm25 is the sparse BM25Index over the same chunks (row i =
+    chunk i) for retrieve(..., bm25=bm25, mode="hybrid" / "lexical").
+    bulk=True encodes uncached chunks on a pool of worker processes.
+    """
+    encoder = None
+    if bulk:
+        from utils.bulk_embed import encode_bulk
+        encoder = lambda texts: encode_bulk(texts)[0]
+    emb = encode_chunks(chunks, encoder=encoder)
     # normalized inner product for cosine
     faiss.normalize_L2(emb)
-    dim = emb.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(emb)
-    return index, emb
+    index = make_index(emb, kind=kind, compression=compression)
+    return index, emb.astype(store_dtype, copy=False), build_bm25_index(chunks)
+
+
+def iter_stream_chunk_spans(pages, max_words=450, overlap_sentences=0):
+    """
+    Streaming version of semantic_chunk_spans over (page_no, text) pairs.
+    Each page is cleaned as it arrives; a sentence cut by a page break is
+    carried into the next page. Offsets refer to the cleaned pages joined
+    with newlines, i.e. the text utils.preprocess.join_pages would build,
+    and chunk is that text[start:end]. Only the pages the current chunk
+    may still reach back into are kept.
+    Yields (page_no, chunk, start, end) as soon as a chunk is full.
+    """
+    held = []  # (base offset, cleaned text) of pages not yet behind the last chunk
+
+    def sentences():
+        carry, offset = None, None
+        for page_no, ptext in pages:
+            ptext = clean_text(ptext)
+            if not ptext:
+                continue
+            base = 0 if offset is None else offset + 1
+            offset = base + len(ptext)
+            held.append((base, ptext))
+            sents = [(ptext[a:b], base + a, base + b, page_no) for a, b in _sentence_spans(ptext)]
+            if carry is not None:
+                first = sents[0]
+                sents[0] = (carry[0] + " " + first[0], carry[1], first[2], carry[3])
+            # an unterminated last sentence probably continues on the next page
+            carry = None if sents[-1][0].endswith((".", "!", "?")) else sents.pop()
+            yield from sents
+        if carry is not None:
+            yield carry
+
+    for _, start, end, page_no in _pack_sentences(sentences(), max_words, overlap_sentences):
+        # later chunks never start before this one, so earlier pages can go
+        while len(held) > 1 and held[1][0] <= start:
+            held.pop(0)
+        base = held[0][0]
+        yield page_no, "\n".join(t for _, t in held)[start - base:end - base], start, end
+
+
+def iter_stream_chunks(pages, max_words=450):
+    """Yields (page_no, chunk) as chunks fill up; see iter_stream_chunk_spans."""
+    for page_no, chunk, _, _ in iter_stream_chunk_spans(pages, max_words):
+        yield page_no, chunk
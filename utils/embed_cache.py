@@ -0,0 +1,55 @@
+# utils/embed_cache.py
+import hashlib
+import os
+import sqlite3
+import numpy as np
+
+# persistent (content hash, model) -> vector store shared by all sessions
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(os.getcwd(), ".cache", "embeddings.db"))
+
+# stay under SQLite's host-parameter limit on older builds
+_LOOKUP_BATCH = 500
+
+
+def _connect():
+    os.makedirs(os.path.dirname(EMBED_CACHE_PATH), exist_ok=True)
+    conn = sqlite3.connect(EMBED_CACHE_PATH)
+    conn.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+                    hash TEXT,
+                    model TEXT,
+                    dim INTEGER,
+                    vector BLOB,
+                    PRIMARY KEY (hash, model)
+                )""")
+    return conn
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def get_embeddings(hashes, model):
+    """Return {hash: float32 vector} for the hashes already stored for this model."""
+    found = {}
+    unique = list(dict.fromkeys(hashes))
+    conn = _connect()
+    c = conn.cursor()
+    for i in range(0, len(unique), _LOOKUP_BATCH):
+        batch = unique[i:i + _LOOKUP_BATCH]
+        marks = ",".join("?" * len(batch))
+        c.execute(f"SELECT hash, vector FROM embeddings WHERE model=? AND hash IN ({marks})", [model, *batch])
+        for h, blob in c.fetchall():
+            found[h] = np.frombuffer(blob, dtype="float32")
+    conn.close()
+    return found
+
+
+def put_embeddings(hashes, vectors, model):
+    vectors = np.asarray(vectors, dtype="float32")
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR REPLACE INTO embeddings (hash, model, dim, vector) VALUES (?, ?, ?, ?)",
+        [(h, model, int(v.shape[0]), v.tobytes()) for h, v in zip(hashes, vectors)]
+    )
+    conn.commit()
+    conn.close()
@@ -0,0 +1,133 @@
+# utils/embed_service.py
+import os
+import threading
+import queue
+import time
+from concurrent.futures import Future
+import numpy as np
+
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+# micro-batching: flush when this many texts are queued or the oldest waited this long
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+# "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime graph from ONNX_MODEL_DIR)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# torch device, e.g. "cpu" or "cuda"; unset lets sentence-transformers pick CUDA when available
+EMBED_DEVICE = os.getenv("EMBED_DEVICE") or None
+
+
+def load_model(model_name=EMBED_MODEL_NAME, backend=EMBED_BACKEND):
+    """Instantiate the encoder for a backend; both expose encode() and get_sentence_embedding_dimension()."""
+    if backend == "onnx":
+        from utils.onnx_backend import OnnxEncoder, ONNX_MODEL_DIR, exported_model_name
+        exported = exported_model_name()
+        if exported is not None and exported != model_name:
+            raise ValueError(f"ONNX_MODEL_DIR={ONNX_MODEL_DIR} holds {exported}, not {model_name}")
+        return OnnxEncoder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=EMBED_DEVICE)
+
+
+class EmbeddingService:
+    """
+    One model per process, shared by every Streamlit session. Small encode
+    requests (typically single queries) are queued and a background thread
+    encodes whatever arrived within max_wait_ms as one batch of up to
+    max_batch_size texts. Requests at least that large skip the queue.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL_NAME, max_batch_size=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS,
+                 backend=EMBED_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = load_model(self.model_name, self.backend)
+        return self._model
+
+    @property
+    def cache_key(self):
+        """Model identity for caches; int8 ONNX vectors differ slightly from torch ones."""
+        if self.backend == "torch":
+            return self.model_name
+        if self.backend == "onnx":
+            from utils.onnx_backend import ONNX_MODEL_DIR, exported_model_name
+            if exported_model_name() is None:
+                # an export without export.json cannot be checked against model_name; key on its directory
+                return f"{self.model_name}@onnx:{os.path.abspath(ONNX_MODEL_DIR)}"
+        return f"{self.model_name}@{self.backend}"
+
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=32):
+        """Encode a list of texts to a float32 array (one row per text)."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension()), dtype="float32")
+        if len(texts) >= self.max_batch_size:
+            return self._encode(texts, batch_size)
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((texts, fut))
+        return fut.result()
+
+    def _encode(self, texts, batch_size=32):
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True).astype("float32")
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._load_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [t for item_texts, _ in pending for t in item_texts]
+            try:
+                emb = self._encode(texts, batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            start = 0
+            for item_texts, fut in pending:
+                fut.set_result(emb[start:start + len(item_texts)])
+                start += len(item_texts)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name=EMBED_MODEL_NAME):
+    """Process-wide EmbeddingService for model_name (created on first use)."""
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name)
+        return _services[model_name]
@@ -1,19 +1,278 @@
 # utils/extract.py
 import pypdf
 import base64
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from utils.lru import LRU
 
-def extract_pdf(file_obj):
+try:
+    import pypdfium2  # optional: rasterized page previews
+except ImportError:
+    pypdfium2 = None
+
+# on-disk cache of per-page text, keyed by sha256 of the PDF bytes
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "extract"))
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# parallel extraction: pool size and how many pages each worker task parses
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(8, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "32"))
+
+# rendered previews kept in memory, keyed by (digest, page(s), scale)
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "64"))
+_preview_cache = LRU(PREVIEW_CACHE_SIZE)
+
+
+def _read_bytes(file_obj):
+    """Return the full contents of an uploaded file-like object (or raw bytes)."""
+    if isinstance(file_obj, (bytes, bytearray)):
+        return bytes(file_obj)
+    file_obj.seek(0)
+    data = file_obj.read()
+    file_obj.seek(0)
+    return data
+
+
+def pdf_digest(data):
+    """Content hash used as the cache key for a PDF."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(file_obj):
+    """pdf_digest of an uploaded file-like object."""
+    return pdf_digest(_read_bytes(file_obj))
+
+
+def _cache_path(digest):
+    return os.path.join(EXTRACT_CACHE_DIR, f"{digest}.json")
+
+
+def _cache_get(digest):
+    path = _cache_path(digest)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # bump mtime so eviction is least-recently-used rather than oldest-written
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return pages
+
+
+def _cache_put(digest, pages):
+    os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+    path = _cache_path(digest)
+    # unique per writer: sessions are threads of one process, so a pid-based name would collide
+    fd, tmp = tempfile.mkstemp(dir=EXTRACT_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    os.replace(tmp, path)
+    _cache_evict()
+
+
+def _cache_evict():
+    """Drop least-recently-used entries until the cache fits EXTRACT_CACHE_MAX_BYTES."""
+    entries = []
+    for name in os.listdir(EXTRACT_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(EXTRACT_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= EXTRACT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _parse_pages(data, start=0, stop=None):
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    stop = len(reader.pages) if stop is None else stop
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _page_count(data):
+    return len(pypdf.PdfReader(io.BytesIO(data)).pages)
+
+
+def _extract_range(args):
+    """Worker entry point: (data, start, stop) -> page texts. Must stay top-level to pickle."""
+    data, start, stop = args
+    return _parse_pages(data, start, stop)
+
+
+def extract_pages(file_obj, use_cache=True):
+    """Return a list with the extracted text of every page (empty string for blank pages)."""
+    data = _read_bytes(file_obj)
+    digest = pdf_digest(data)
+    if use_cache:
+        pages = _cache_get(digest)
+        if pages is not None:
+            return pages
+    pages = _parse_pages(data)
+    if use_cache:
+        _cache_put(digest, pages)
+    return pages
+
+
+def iter_pdf_pages(file_obj, use_cache=True):
+    """
+    Yield (page_no, text) one page at a time, page_no starting at 1.
+    Cached PDFs are replayed from disk; otherwise pages are parsed lazily and
+    the cache entry is written once the last page has been yielded.
+    """
+    data = _read_bytes(file_obj)
+    digest = pdf_digest(data)
+    pages = _cache_get(digest) if use_cache else None
+    if pages is not None:
+        for i, ptext in enumerate(pages, 1):
+            yield i, ptext
+        return
+
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    seen = []
+    for i, page in enumerate(reader.pages, 1):
+        ptext = page.extract_text() or ""
+        seen.append(ptext)
+        yield i, ptext
+    if use_cache:
+        _cache_put(digest, seen)
+
+
+def extract_pdf(file_obj, use_cache=True):
     """Accepts an uploaded file-like object and returns extracted text."""
-    reader = pypdf.PdfReader(file_obj)
-    text = []
-    for page in reader.pages:
-        ptext = page.extract_text()
-        if ptext:
-            text.append(ptext)
-    return "\n".join(text)
+    return "\n".join(p for p in extract_pages(file_obj, use_cache=use_cache) if p)
+
+
+def extract_pages_many(file_objs, max_workers=None, pages_per_task=PAGES_PER_TASK, use_cache=True):
+    """
+    Extract several PDFs at once. Cache misses are split into page ranges and
+    spread over a bounded process pool; results come back in file/page order.
+    Returns one list of page texts per input file.
+    """
+    datas = [_read_bytes(f) for f in file_objs]
+    digests = [pdf_digest(d) for d in datas]
+    results = [None] * len(datas)
+
+    # (file position, range start, range stop) for every piece of uncached work
+    tasks = []
+    for i, (data, digest) in enumerate(zip(datas, digests)):
+        if use_cache:
+            results[i] = _cache_get(digest)
+        if results[i] is None:
+            n = _page_count(data)
+            for start in range(0, n, pages_per_task):
+                tasks.append((i, start, min(start + pages_per_task, n)))
+            results[i] = [""] * n
+
+    if not tasks:
+        return results
+
+    workers = min(max_workers or EXTRACT_WORKERS, len(tasks))
+    if workers <= 1:
+        for i, start, stop in tasks:
+            results[i][start:stop] = _parse_pages(datas[i], start, stop)
+    else:
+        # spawn: forking the app process, which already runs embedding / LLM / torch threads, can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            parts = pool.map(_extract_range, [(datas[i], start, stop) for i, start, stop in tasks])
+            for (i, start, stop), pages in zip(tasks, parts):
+                results[i][start:stop] = pages
+
+    if use_cache:
+        for i in {t[0] for t in tasks}:
+            _cache_put(digests[i], results[i])
+    return results
+
+
+def extract_pdfs(file_objs, max_workers=None, use_cache=True):
+    """Parallel counterpart of extract_pdf: one joined text per input file."""
+    return [
+        "\n".join(p for p in pages if p)
+        for pages in extract_pages_many(file_objs, max_workers=max_workers, use_cache=use_cache)
+    ]
 
 def display_pdf(file_obj):
     """Return an HTML iframe for Streamlit display. file_obj is the uploaded BytesIO."""
     file_obj.seek(0)
     base64_pdf = base64.b64encode(file_obj.read()).decode('utf-8')
     return f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600px"></iframe>'
+
+
+def _preview_get(key):
+    return _preview_cache.get(key)
+
+
+def _preview_put(key, value):
+    _preview_cache.put(key, value)
+    return value
+
+
+def pdf_page_count(file_obj):
+    data = _read_bytes(file_obj)
+    key = ("count", pdf_digest(data))
+    cached = _preview_get(key)
+    return cached if cached is not None else _preview_put(key, _page_count(data))
+
+
+def can_render_pages():
+    """True when pypdfium2 is installed and render_pdf_page can rasterize pages."""
+    return pypdfium2 is not None
+
+
+def render_pdf_page(file_obj, page_no, scale=1.5):
+    """Rasterize a single page (1-based) to PNG bytes, caching the result."""
+    if pypdfium2 is None:
+        raise RuntimeError("pypdfium2 is not installed; use display_pdf_pages instead")
+    data = _read_bytes(file_obj)
+    key = ("png", pdf_digest(data), page_no, scale)
+    cached = _preview_get(key)
+    if cached is not None:
+        return cached
+    doc = pypdfium2.PdfDocument(data)
+    try:
+        image = doc[page_no - 1].render(scale=scale).to_pil()
+    finally:
+        doc.close()
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return _preview_put(key, buf.getvalue())
+
+
+def display_pdf_pages(file_obj, pages, height=600):
+    """
+    Like display_pdf, but embeds only the requested 1-based pages as a small
+    standalone PDF instead of the whole upload. The iframe HTML is cached.
+    """
+    data = _read_bytes(file_obj)
+    pages = tuple(pages)
+    key = ("html", pdf_digest(data), pages, height)
+    cached = _preview_get(key)
+    if cached is not None:
+        return cached
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    writer = pypdf.PdfWriter()
+    for p in pages:
+        if 1 <= p <= len(reader.pages):
+            writer.add_page(reader.pages[p - 1])
+    buf = io.BytesIO()
+    writer.write(buf)
+    base64_pdf = base64.b64encode(buf.getvalue()).decode('utf-8')
+    html = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="{height}px"></iframe>'
+    return _preview_put(key, html)
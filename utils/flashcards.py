@@ -1,5 +1,6 @@
 # utils/flashcards.py
 from utils.notes_db import save_flashcard
+from utils.async_llm import agroq_chat, aollama_chat, run_sync
 import re
 import json
 
@@ -8,13 +9,15 @@ def generate_flashcards_from_text(text, max_cards=30, llm="groq", model="llama-3
     Generate high-quality flashcards using LLM.
     Creates proper question-answer pairs from the text.
     """
+    return run_sync(agenerate_flashcards_from_text(text, max_cards=max_cards, llm=llm, model=model,
+                                                   temperature=temperature))
+
+
+async def agenerate_flashcards_from_text(text, max_cards=30, llm="groq", model="llama-3.1-70b-versatile", temperature=0.3):
+    """Async generate_flashcards_from_text; returns the same list of (front, back)."""
     
     # Use LLM to generate flashcards
     if llm == "groq":
-        from groq import Groq
-        import os
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
         prompt = f"""You are a professional educator. Create {max_cards} study flashcards from the text below.
 
         CRITICAL RULES:
@@ -39,14 +42,7 @@ def generate_flashcards_from_text(text, max_cards=30, llm="groq", model="llama-3
         Return ONLY a JSON array of flashcard objects. No explanations, no markdown:"""
 
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=4000
-            )
-            
-            result = response.choices[0].message.content.strip()
+            result = (await agroq_chat(prompt, model=model, temperature=temperature, max_tokens=4000)).strip()
             
             # Extract JSON from response (handle markdown code blocks)
             
@@ -101,7 +97,6 @@ def generate_flashcards_from_text(text, max_cards=30, llm="groq", model="llama-3
             return generate_flashcards_simple(text, max_cards)
     
     elif llm == "ollama":
-        import requests
         import os
         
         ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
@@ -131,17 +126,8 @@ def generate_flashcards_from_text(text, max_cards=30, llm="groq", model="llama-3
 
         JSON OUTPUT:"""
         try:
-            response = requests.post(
-                f"{ollama_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "temperature": temperature
-                }
-            )
-            
-            result = response.json()["response"].strip()
+            result = (await aollama_chat(prompt, model=model, temperature=temperature, max_tokens=4000,
+                                         url=ollama_url)).strip()
             
             # Extract JSON
             if "```json" in result:
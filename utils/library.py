@@ -0,0 +1,134 @@
+# utils/library.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+import numpy as np
+
+# one sub-directory per ingested document: embeddings.npy, provenance.npy + text.txt (or chunks.json
+# when there is no text), meta.json. The FAISS index itself is rebuilt per session from these vectors.
+LIBRARY_DIR = os.getenv("LIBRARY_DIR", os.path.join(os.getcwd(), "library"))
+
+
+def corpus_id(digests, *params):
+    """Stable id for a set of document hashes plus whatever changes the chunking (e.g. max_words)."""
+    key = "|".join(sorted(digests)) + "|" + "|".join(str(p) for p in params)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _doc_dir(doc_id):
+    return os.path.join(LIBRARY_DIR, doc_id)
+
+
+def has_entry(doc_id):
+    return os.path.exists(os.path.join(_doc_dir(doc_id), "meta.json"))
+
+
+def save_entry(doc_id, chunks=None, embeddings=None, provenance=None, text=None, **meta):
+    """
+    Write a document's vectors and chunk table; provenance is an optional
+    per-chunk array (e.g. Corpus.provenance_table rows) and text the cleaned
+    document text its spans refer to. An entry with text and provenance is
+    stored as spans only: its chunks are text[start:end], so chunks.json is
+    skipped. The entry is written to a temporary directory and renamed into
+    place, so readers (and arrays mapped from an older copy) never see a
+    half-written one.
+    """
+    os.makedirs(LIBRARY_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=LIBRARY_DIR)
+    try:
+        if embeddings is not None:
+            np.save(os.path.join(tmp, "embeddings.npy"), np.asarray(embeddings))
+        if provenance is not None:
+            np.save(os.path.join(tmp, "provenance.npy"), np.asarray(provenance))
+        if text is not None:
+            with open(os.path.join(tmp, "text.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+        if text is None or provenance is None:
+            with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(list(chunks), f)
+        n_chunks = len(chunks) if chunks is not None else len(provenance)
+        meta.update({"n_chunks": n_chunks, "created_at": datetime.utcnow().isoformat()})
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        _replace_dir(tmp, _doc_dir(doc_id))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _replace_dir(src, dst):
+    # a directory cannot be renamed over a non-empty one: move the old entry aside first.
+    # Its files are unlinked, not rewritten, so sessions that mapped them keep valid pages.
+    old = None
+    if os.path.exists(dst):
+        old = os.path.join(LIBRARY_DIR, f".old-{uuid.uuid4().hex}")
+        os.replace(dst, old)
+    try:
+        os.replace(src, dst)
+    except OSError:
+        # another writer put the same entry in place first; keep theirs
+        if not os.path.isdir(dst):
+            raise
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def load_entry(doc_id, mmap=True):
+    """
+    Reopen a saved entry. With mmap=True the embeddings are memory-mapped
+    read-only, so opening is fast and every session of the server shares
+    the same pages. Returns (embeddings, chunks, meta) or None when the
+    entry does not exist; embeddings is None if they were not saved, chunks
+    is None for a spans-only entry (see load_provenance and load_text).
+    """
+    if not has_entry(doc_id):
+        return None
+    path = _doc_dir(doc_id)
+    emb_path = os.path.join(path, "embeddings.npy")
+    embeddings = np.load(emb_path, mmap_mode="r" if mmap else None) if os.path.exists(emb_path) else None
+    chunks = None
+    chunks_path = os.path.join(path, "chunks.json")
+    if os.path.exists(chunks_path):
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return embeddings, chunks, meta
+
+
+def load_provenance(doc_id):
+    """Per-chunk provenance array saved with the entry, or None."""
+    path = os.path.join(_doc_dir(doc_id), "provenance.npy")
+    return np.load(path) if os.path.exists(path) else None
+
+
+def load_text(doc_id):
+    """Document text saved with the entry, or None."""
+    path = os.path.join(_doc_dir(doc_id), "text.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def list_library():
+    """Return (doc_id, meta) for every complete entry, newest first."""
+    entries = []
+    if not os.path.isdir(LIBRARY_DIR):
+        return entries
+    for doc_id in os.listdir(LIBRARY_DIR):
+        if doc_id.startswith("."):
+            continue  # entries still being written or replaced
+        meta_path = os.path.join(_doc_dir(doc_id), "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                entries.append((doc_id, json.load(f)))
+    entries.sort(key=lambda e: e[1].get("created_at", ""), reverse=True)
+    return entries
+
+
+def delete_entry(doc_id):
+    shutil.rmtree(_doc_dir(doc_id), ignore_errors=True)
@@ -1,31 +1,65 @@
 # utils/llm.py
 import os
-import requests
-from groq import Groq
+import asyncio
 import json
 from typing import Dict, List
+from utils.clients import get_groq_client, get_ollama_session, request_timeout
+from utils.async_llm import agroq_chat, aollama_chat, achat, run_sync
+from utils.llm_cache import get_response, put_response
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 DEFAULT = os.getenv("DEFAULT_LLM", "groq")
 
-# Groq client (cloud)
-groq_client = None
-if GROQ_KEY:
-    groq_client = Groq(api_key=GROQ_KEY)
+# map-reduce summaries: words per mapped section, sections summarized at once, notes merged per reduce call
+SUMMARY_SECTION_WORDS = int(os.getenv("SUMMARY_SECTION_WORDS", "1500"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_REDUCE_FAN_IN = int(os.getenv("SUMMARY_REDUCE_FAN_IN", "8"))
+SUMMARY_RETRIES = int(os.getenv("SUMMARY_RETRIES", "2"))  # extra attempts per failed section/merge call
+
+def __getattr__(name):
+    # Groq client (cloud), shared with every call below
+    if name == "groq_client":
+        return get_groq_client() if GROQ_KEY else None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def groq_chat(prompt, model="llama-3.1-8b-instant", temperature=0.7, max_tokens=2048):
-    from groq import Groq
-    client = Groq()
+    return run_sync(agroq_chat(prompt, model=model, temperature=temperature, max_tokens=max_tokens))
+
+
+def _cached_stream(provider, model, temperature, prompt, stream, **params):
+    # a cached response is yielded in one piece; a completed stream is stored
+    cached = get_response(provider, model, temperature, prompt, **params)
+    if cached is not None:
+        yield cached
+        return
+    pieces = []
+    for piece in stream():
+        pieces.append(piece)
+        yield piece
+    put_response(provider, model, temperature, prompt, "".join(pieces), **params)
+
 
-    res = client.chat.completions.create(
+def groq_chat_stream(prompt, model="llama-3.1-8b-instant", temperature=0.7, max_tokens=2048, system=None):
+    """Like groq_chat, but yields the completion piece by piece as tokens arrive."""
+    return _cached_stream("groq", model, temperature, prompt,
+                          lambda: _groq_stream(prompt, model, temperature, max_tokens, system),
+                          max_tokens=max_tokens, system=system)
+
+
+def _groq_stream(prompt, model, temperature, max_tokens, system):
+    client = get_groq_client()
+    messages = [{"role": "system", "content": system}] if system else []
+    stream = client.chat.completions.create(
         model=model,
-        messages=[{"role": "user", "content": prompt}],
+        messages=messages + [{"role": "user", "content": prompt}],
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        stream=True
     )
-
-    return res.choices[0].message.content
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
 
 
@@ -35,41 +69,163 @@ def ollama_chat(prompt: str, model="llama2", temperature=0.2, max_tokens=1024):
     Expects an endpoint POST /api/generate with JSON: {model, prompt, temperature}
     Adjust if your Ollama API differs.
     """
-    payload = {"model": model, "prompt": prompt, "temperature": temperature, "max_tokens": max_tokens}
     try:
-        r = requests.post(f"{OLLAMA_URL}/api/generate", json=payload, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        # The response format may differ across versions; adapt if needed.
-        if isinstance(data, dict) and "text" in data:
-            return data["text"]
-        # fallback: join outputs
-        return data.get("response") or json.dumps(data)
+        return run_sync(aollama_chat(prompt, model=model, temperature=temperature, max_tokens=max_tokens))
     except Exception as e:
         return f"Error calling local Ollama LLM: {e}"
 
-def generate_summary(text: str, llm="default", model=None, temperature=0.2):
-    prompt = (
+def ollama_chat_stream(prompt: str, model="llama2", temperature=0.2, max_tokens=1024, system=None, url=None):
+    """
+    Like ollama_chat, but with "stream": true: Ollama sends one JSON object
+    per line and each "response" piece is yielded as soon as it arrives.
+    """
+    return _cached_stream("ollama", model, temperature, prompt,
+                          lambda: _ollama_stream(prompt, model, temperature, max_tokens, system, url),
+                          max_tokens=max_tokens, system=system)
+
+def _ollama_stream(prompt, model, temperature, max_tokens, system, url):
+    payload = {"model": model, "prompt": prompt, "stream": True, "temperature": temperature, "max_tokens": max_tokens}
+    if system:
+        payload["system"] = system
+    with get_ollama_session().post(f"{url or OLLAMA_URL}/api/generate", json=payload, stream=True,
+                                   timeout=request_timeout()) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("response"):
+                yield data["response"]
+            if data.get("done"):
+                break
+
+def _summary_prompt(text):
+    return (
         "You are an expert note-maker. Produce a structured study summary with:\n"
         "- Short introduction\n- Key points (bullet list)\n- Definitions\n- Examples (if applicable)\n- Equations/formulas (if any)\n- Short quiz (3 Q&A)\n\n"
         f"Text:\n{text}\n\nFormat clearly."
     )
+
+def generate_summary(text: str, llm="default", model=None, temperature=0.2):
+    return run_sync(agenerate_summary(text, llm=llm, model=model, temperature=temperature))
+
+async def agenerate_summary(text: str, llm="default", model=None, temperature=0.2):
+    prompt = _summary_prompt(text)
     if llm == "ollama":
-        return ollama_chat(prompt, model=model or "llama2", temperature=temperature, max_tokens=2048)
-    else:
-        return groq_chat(prompt, model=model or "llama-3.1-8b-instant", temperature=temperature, max_tokens=2048)
+        try:
+            return await achat(prompt, llm="ollama", model=model, temperature=temperature, max_tokens=2048)
+        except Exception as e:
+            return f"Error calling local Ollama LLM: {e}"
+    return await achat(prompt, llm="groq", model=model, temperature=temperature, max_tokens=2048)
+
+def summary_sections(text: str, section_words=None):
+    """The sections map_reduce_summary summarizes separately; one section needs no map step."""
+    from utils.embed import semantic_chunks
+    return semantic_chunks(text, max_words=section_words or SUMMARY_SECTION_WORDS)
 
+async def asummarize_sections(text: str, llm="default", model=None, temperature=0.2, section_words=None,
+                              concurrency=None, fan_in=None, sections=None):
+    """
+    Map-reduce over the whole text: summary_sections of section_words are
+    turned into notes in parallel (at most concurrency calls in flight),
+    then merged fan_in at a time until at most fan_in notes remain.
+    Failed calls (rate limits, timeouts) are retried with backoff; a section
+    that still fails is left out and a failed merge keeps its notes unmerged.
+    Raises only if every section fails. Returns the notes for the final
+    structured summary. sections, if already split, saves splitting again.
+    """
+    fan_in = max(2, fan_in or SUMMARY_REDUCE_FAN_IN)
+    sem = asyncio.Semaphore(concurrency or SUMMARY_CONCURRENCY)
 
+    async def call(prompt):
+        for attempt in range(SUMMARY_RETRIES + 1):
+            try:
+                async with sem:
+                    return await achat(prompt, llm=llm, model=model, temperature=temperature, max_tokens=1024)
+            except Exception:
+                if attempt == SUMMARY_RETRIES:
+                    raise
+                await asyncio.sleep(2 ** attempt)
 
-def answer_with_context(question, context_chunks, llm="groq", model="llama-3.1-70b-versatile", temperature=0.3):
+    sections = summary_sections(text, section_words) if sections is None else sections
+    results = await asyncio.gather(*[call(
+        f"You are an expert note-maker. Write concise study notes for part {i} of {len(sections)} of a document: "
+        "key points, definitions, examples and any equations/formulas. Keep specific facts and names.\n\n"
+        f"Text:\n{section}"
+    ) for i, section in enumerate(sections, 1)], return_exceptions=True)
+    notes = [r for r in results if not isinstance(r, BaseException)]
+    if results and not notes:
+        raise results[0]
+    while len(notes) > fan_in:
+        groups = [notes[i:i + fan_in] for i in range(0, len(notes), fan_in)]
+        merged = await asyncio.gather(*[call(
+            "Merge these consecutive study notes into one set of notes in the same order. "
+            "Remove repetition but keep every distinct key point, definition, example and formula.\n\n"
+            + "\n\n---\n\n".join(group)
+        ) for group in groups], return_exceptions=True)
+        notes = ["\n\n".join(group) if isinstance(m, BaseException) else m for group, m in zip(groups, merged)]
+    return notes
+
+async def amap_reduce_summary(text: str, llm="default", model=None, temperature=0.2, section_words=None,
+                              concurrency=None, fan_in=None):
+    """generate_summary over the whole text instead of its first few pages; see asummarize_sections."""
+    sections = summary_sections(text, section_words)
+    if len(sections) <= 1:
+        return await agenerate_summary(text, llm=llm, model=model, temperature=temperature)
+    try:
+        notes = await asummarize_sections(text, llm, model, temperature, section_words, concurrency, fan_in,
+                                          sections=sections)
+    except Exception as e:
+        if llm != "ollama":
+            raise
+        return f"Error calling local Ollama LLM: {e}"
+    return await agenerate_summary("\n\n".join(notes), llm=llm, model=model, temperature=temperature)
+
+def map_reduce_summary(text: str, llm="default", model=None, temperature=0.2, section_words=None,
+                       concurrency=None, fan_in=None):
+    return run_sync(amap_reduce_summary(text, llm, model, temperature, section_words, concurrency, fan_in))
+
+def map_reduce_summary_stream(text: str, llm="default", model=None, temperature=0.2, section_words=None,
+                              concurrency=None, fan_in=None):
     """
-    Answer questions using retrieved context
+    Runs the map and merge steps, then streams the final structured summary.
+    A text that fits in one section is streamed straight away.
     """
-    
+    sections = summary_sections(text, section_words)
+    if len(sections) <= 1:
+        return generate_summary_stream(text, llm=llm, model=model, temperature=temperature)
+    try:
+        notes = run_sync(asummarize_sections(text, llm, model, temperature, section_words, concurrency, fan_in,
+                                             sections=sections))
+    except Exception as e:
+        if llm != "ollama":
+            raise
+        return iter([f"Error calling local Ollama LLM: {e}"])
+    return generate_summary_stream("\n\n".join(notes), llm=llm, model=model, temperature=temperature)
+
+def _ollama_errors_as_text(stream):
+    # like ollama_chat: a local server that is down gives an error message, not a traceback
+    try:
+        yield from stream
+    except Exception as e:
+        yield f"Error calling local Ollama LLM: {e}"
+
+def generate_summary_stream(text: str, llm="default", model=None, temperature=0.2):
+    """Streaming generate_summary: yields the summary as it is written."""
+    prompt = _summary_prompt(text)
+    if llm == "ollama":
+        return _ollama_errors_as_text(ollama_chat_stream(prompt, model=model or "llama2", temperature=temperature,
+                                                         max_tokens=2048))
+    return groq_chat_stream(prompt, model=model or "llama-3.1-8b-instant", temperature=temperature, max_tokens=2048)
+
+
+ANSWER_SYSTEM_PROMPT = "You are a knowledgeable study assistant. Answer questions naturally without citing sources or mentioning chunks."
+
+def _answer_prompt(question, hits):
     # Build context from chunks
-    context = "\n\n".join([f"Passage {i+1}: {chunk}" for i, chunk in enumerate(context_chunks)])
+    context = "\n\n".join([f"Passage {i+1}: {h['chunk']}" for i, h in enumerate(hits)])
     
-    prompt = f"""You are a helpful study assistant. Answer the question based on the provided context.
+    return f"""You are a helpful study assistant. Answer the question based on the provided context.
 
 RULES:
 1. Answer naturally in complete sentences
@@ -87,50 +243,58 @@ QUESTION: {question}
 
 ANSWER (respond naturally without references):"""
 
+def _used_chunks(hits):
+    # Return the chunks used (for optional "show sources" feature)
+    return [
+        dict(
+            h,
+            index=h.get("index", i),
+            norm_score=h.get("norm_score", 0.8)  # retrieval score when available
+        )  # keeps file/page provenance from retrieve()
+        for i, h in enumerate(hits[:3])  # Show top 3
+    ]
+
+def answer_with_context(question, context_chunks, llm="groq", model="llama-3.1-70b-versatile", temperature=0.3):
+    """
+    Answer questions using retrieved context
+    """
+    return run_sync(aanswer_with_context(question, context_chunks, llm=llm, model=model, temperature=temperature))
+
+
+async def aanswer_with_context(question, context_chunks, llm="groq", model="llama-3.1-70b-versatile", temperature=0.3):
+    """Async answer_with_context; same result dict."""
+    # accept plain strings or retrieve()/pack_context() hits
+    hits = [c if isinstance(c, dict) else {"chunk": c} for c in context_chunks]
+    prompt = _answer_prompt(question, hits)
+
     if llm == "groq":
-        from groq import Groq
-        import os
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a knowledgeable study assistant. Answer questions naturally without citing sources or mentioning chunks."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature,
-            max_tokens=1000
-        )
-        answer = response.choices[0].message.content.strip()
-    
+        answer = await agroq_chat(prompt, model=model, temperature=temperature, max_tokens=1000,
+                                  system=ANSWER_SYSTEM_PROMPT)
     elif llm == "ollama":
-        import requests
-        import os
-        
-        ollama_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        response = requests.post(
-            f"{ollama_url}/api/generate",
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": temperature,
-                "system": "You are a knowledgeable study assistant. Answer questions naturally without citing sources or mentioning chunks."
-            }
-        )
-        answer = response.json()["response"].strip()
-    
-    # Return answer and the chunks used (for optional "show sources" feature)
-    used_chunks = [
-        {
-            "index": i,
-            "chunk": chunk,
-            "norm_score": 0.8  # You can calculate actual scores if available
-        }
-        for i, chunk in enumerate(context_chunks[:3])  # Show top 3
-    ]
+        answer = await aollama_chat(prompt, model=model, temperature=temperature, max_tokens=1000,
+                                    system=ANSWER_SYSTEM_PROMPT,
+                                    url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
     
     return {
-        "answer": answer,
-        "used_chunks": used_chunks
+        "answer": answer.strip(),
+        "used_chunks": _used_chunks(hits)
+    }
+
+
+def answer_with_context_stream(question, context_chunks, llm="groq", model="llama-3.1-70b-versatile", temperature=0.3):
+    """
+    Streaming answer_with_context: same prompt and sources, but "stream" is a
+    generator of answer pieces to render as they arrive instead of "answer".
+    """
+    hits = [c if isinstance(c, dict) else {"chunk": c} for c in context_chunks]
+    prompt = _answer_prompt(question, hits)
+    if llm == "ollama":
+        stream = ollama_chat_stream(prompt, model=model, temperature=temperature, max_tokens=1000,
+                                    system=ANSWER_SYSTEM_PROMPT, url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+    else:
+        stream = groq_chat_stream(prompt, model=model, temperature=temperature, max_tokens=1000,
+                                  system=ANSWER_SYSTEM_PROMPT)
+    return {
+        "stream": stream,
+        "used_chunks": _used_chunks(hits)
     }
\ No newline at end of file
@@ -0,0 +1,117 @@
+# utils/llm_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from utils.notes_db import DB_PATH
+
+# completed LLM responses keyed by provider, model, temperature and a hash of the prompt
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+# only (near-)deterministic calls are cached; sampled ones should give a fresh answer on regenerate
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    model TEXT,
+                    temperature REAL,
+                    prompt_hash TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+    conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+    conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER
+                )""")
+    return conn
+
+
+def prompt_hash(prompt, **params):
+    """sha256 of the prompt plus anything else that changes the output (system prompt, max_tokens)."""
+    payload = json.dumps([prompt, sorted(params.items())], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cacheable(temperature):
+    return LLM_CACHE_ENABLED and float(temperature) <= LLM_CACHE_MAX_TEMPERATURE
+
+
+def _key(provider, model, temperature, phash):
+    return f"{provider}|{model}|{float(temperature):g}|{phash}"
+
+
+def _count(conn, name):
+    conn.execute("INSERT INTO llm_cache_stats (name, value) VALUES (?, 1) "
+                 "ON CONFLICT(name) DO UPDATE SET value=value+1", (name,))
+
+
+def get_response(provider, model, temperature, prompt, **params):
+    """Cached response text, or None. Counts a hit or a miss; calls above LLM_CACHE_MAX_TEMPERATURE are skipped."""
+    if not cacheable(temperature):
+        return None
+    now = time.time()
+    key = _key(provider, model, temperature, prompt_hash(prompt, **params))
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT response FROM llm_cache WHERE key=? AND created_at>=?", (key, now - LLM_CACHE_TTL))
+    row = c.fetchone()
+    if row is None:
+        _count(conn, "misses")
+    else:
+        _count(conn, "hits")
+        c.execute("UPDATE llm_cache SET last_used=? WHERE key=?", (now, key))
+    conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+
+def put_response(provider, model, temperature, prompt, response, **params):
+    """Store a response, then drop expired and least recently used entries beyond LLM_CACHE_MAX_ENTRIES."""
+    if not cacheable(temperature) or response is None:
+        return
+    now = time.time()
+    phash = prompt_hash(prompt, **params)
+    conn = _connect()
+    conn.execute("INSERT OR REPLACE INTO llm_cache "
+                 "(key, provider, model, temperature, prompt_hash, response, created_at, last_used) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                 (_key(provider, model, temperature, phash), provider, model, float(temperature), phash,
+                  response, now, now))
+    conn.execute("DELETE FROM llm_cache WHERE created_at<?", (now - LLM_CACHE_TTL,))
+    excess = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        conn.execute("DELETE FROM llm_cache WHERE key IN "
+                     "(SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)", (excess,))
+    conn.commit()
+    conn.close()
+
+
+def cache_stats():
+    """{"hits", "misses", "entries"} since the cache was created (or last cleared)."""
+    conn = _connect()
+    c = conn.cursor()
+    c.execute("SELECT name, value FROM llm_cache_stats")
+    stats = {"hits": 0, "misses": 0}
+    stats.update(dict(c.fetchall()))
+    c.execute("SELECT COUNT(*) FROM llm_cache")
+    stats["entries"] = c.fetchone()[0]
+    conn.close()
+    return stats
+
+
+def clear_cache():
+    conn = _connect()
+    conn.execute("DELETE FROM llm_cache")
+    conn.execute("DELETE FROM llm_cache_stats")
+    conn.commit()
+    conn.close()
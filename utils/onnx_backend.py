@@ -0,0 +1,123 @@
+# utils/onnx_backend.py
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+Export once (needs torch + transformers, which sentence-transformers already pulls in):
+
+    python -m utils.onnx_backend all-MiniLM-L6-v2 models/minilm-onnx
+
+then run with EMBED_BACKEND=onnx ONNX_MODEL_DIR=models/minilm-onnx.
+"""
+import json
+import os
+import sys
+import numpy as np
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getcwd(), "models", "minilm-onnx"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default
+ONNX_MAX_SEQ_LENGTH = int(os.getenv("ONNX_MAX_SEQ_LENGTH", "256"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+EXPORT_INFO_FILE = "export.json"  # records which model the directory was exported from
+
+
+def _short_name(model_name):
+    return model_name.split("/", 1)[1] if model_name.startswith("sentence-transformers/") else model_name
+
+
+def exported_model_name(model_dir=ONNX_MODEL_DIR):
+    """Model name an export directory was built from, or None for exports without export.json."""
+    try:
+        with open(os.path.join(model_dir, EXPORT_INFO_FILE), "r", encoding="utf-8") as f:
+            return _short_name(json.load(f)["model_name"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def export_onnx(model_name, out_dir, quantize=True):
+    """Export the transformer of a SentenceTransformer to ONNX (+ dynamic int8 copy) with its tokenizer."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = AutoModel.from_pretrained(name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={k: {0: "batch", 1: "seq"} for k in ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")},
+            opset_version=14,
+        )
+    if quantize:
+        # needs the onnx package as well as onnxruntime
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+    with open(os.path.join(out_dir, EXPORT_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": _short_name(name)}, f)
+    return out_dir
+
+
+class OnnxEncoder:
+    """
+    Drop-in for the parts of SentenceTransformer the app uses (encode,
+    get_sentence_embedding_dimension): tokenizer -> ONNX transformer ->
+    mean pooling -> L2 normalization, as in all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=True, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No ONNX model at {path}; run `python -m utils.onnx_backend <model> {model_dir}` first")
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        self._dim = None
+
+    def get_sentence_embedding_dimension(self):
+        if self._dim is None:
+            self._dim = self.encode(["dimension probe"]).shape[1]
+        return self._dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        out = []
+        # length-sorted batches pad less; results are put back in input order
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        for i in range(0, len(texts), batch_size):
+            batch = [texts[j] for j in order[i:i + batch_size]]
+            enc = self.tokenizer(batch, padding=True, truncation=True, max_length=ONNX_MAX_SEQ_LENGTH, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in enc.items() if k in self._inputs}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype("float32"))
+        if not out:
+            return np.zeros((0, self._dim or 0), dtype="float32")
+        emb = np.empty((len(texts), out[0].shape[1]), dtype="float32")
+        emb[order] = np.vstack(out)
+        return emb
+
+
+if __name__ == "__main__":
+    model = sys.argv[1] if len(sys.argv) > 1 else "all-MiniLM-L6-v2"
+    out = sys.argv[2] if len(sys.argv) > 2 else ONNX_MODEL_DIR
+    print(f"exported to {export_onnx(model, out)}")
@@ -8,6 +8,23 @@ def clean_text(text):
     text = re.sub(r' {2,}', ' ', text)
     return text
 
+def join_pages(pages):
+    """
+    Clean each page and join the non-empty ones with newlines.
+    Returns (text, page_starts, page_numbers): page_starts[i] is the offset
+    in text where page page_numbers[i] (1-based) begins.
+    """
+    parts, starts, numbers, offset = [], [], [], 0
+    for page_no, ptext in enumerate(pages, 1):
+        ptext = clean_text(ptext)
+        if not ptext:
+            continue
+        starts.append(offset)
+        numbers.append(page_no)
+        parts.append(ptext)
+        offset += len(ptext) + 1
+    return "\n".join(parts), starts, numbers
+
 def split_sentences(text):
     # Simple sentence splitter without NLTK
     sentences = re.split(r'(?<=[.!?])\s+', text)
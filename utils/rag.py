@@ -1,25 +1,186 @@
 # utils/rag.py
+import itertools
+import os
+import re
 import numpy as np
+import faiss
 from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from utils.embed_service import get_embedding_service
+from utils.lru import LRU
 
-RAG_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+def __getattr__(name):
+    # RAG_MODEL is the same shared instance utils.embed uses
+    if name == "RAG_MODEL":
+        return get_embedding_service().model
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def retrieve(query, index, embeddings, chunks, top_k=5):
+# query-time ANN knobs; ignored by exact (flat) indexes
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# bounded LRU caches: query vectors by (model, query) and results by (index version, query, params)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+# hybrid retrieval: candidates taken from each side, and the reciprocal-rank-fusion constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))  # x top_k
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+_query_cache = LRU(QUERY_CACHE_SIZE)
+_result_cache = LRU(RESULT_CACHE_SIZE)
+
+
+# result-cache identity of an index object; unlike id() it is never handed to another index
+_index_tokens = itertools.count()
+
+
+def _index_token(index):
+    token = getattr(index, "_rag_cache_token", None)
+    if token is None:
+        token = next(_index_tokens)
+        index._rag_cache_token = token
+    return token
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def embed_query(query):
+    """Query vector (1 x dim float32), served from the LRU cache when possible."""
+    service = get_embedding_service()
+    key = (service.cache_key, normalize_query(query))
+    q_emb = _query_cache.get(key)
+    if q_emb is None:
+        q_emb = service.encode([query])
+        _query_cache.put(key, q_emb)
+    return q_emb
+
+
+def clear_caches():
+    _query_cache.clear()
+    _result_cache.clear()
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply nprobe (IVF) / efSearch (HNSW) to whichever of them the index supports."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe or DEFAULT_NPROBE
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search or DEFAULT_EF_SEARCH
+
+def retrieve(query, index, embeddings, chunks, top_k=5, nprobe=None, ef_search=None, index_version=None,
+             bm25=None, mode="dense", provenance=None):
     """
     Return top_k chunks and scores. Uses FAISS index for speed,
     then returns chunk texts + normalized scores.
+    nprobe / ef_search tune recall vs. speed for IVF / HNSW indexes.
+    mode="hybrid" fuses the dense ranking with the BM25 ranking from bm25
+    (reciprocal-rank fusion); mode="lexical" uses BM25 only and never
+    touches the embedding model.
+    provenance(chunk_id) -> dict (e.g. Corpus.provenance) adds source
+    metadata such as file, page and character span to every hit.
+    Results are cached per index_version (e.g. Corpus.version; defaults to
+    the index size), so pass a new version whenever the index changes.
     """
-    q_emb = RAG_MODEL.encode([query], convert_to_numpy=True).astype("float32")
-    # normalize for cosine with the index already normalized
-    faiss_scores, idxs = index.search(q_emb, top_k)
+    if mode != "dense" and bm25 is None:
+        raise ValueError(f"mode={mode!r} needs a bm25 index")
+    version = (_index_token(index), index.ntotal if index_version is None else index_version)
+    result_key = (version, normalize_query(query), top_k, nprobe, ef_search, mode, provenance is not None)
+    cached = _result_cache.get(result_key)
+    if cached is not None:
+        return [dict(r) for r in cached]
+
+    if mode == "lexical":
+        ids, scores = bm25.search(query, top_k)
+        result = _hits(scores, ids, chunks, provenance)
+    else:
+        n_dense = top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+        set_search_params(index, nprobe, ef_search)
+        q_emb = embed_query(query)
+        # normalize for cosine with the index already normalized
+        faiss_scores, idxs = index.search(q_emb, n_dense)
+        result = _hits(faiss_scores[0], idxs[0], chunks, provenance)
+        if mode == "hybrid":
+            result = _fuse(result, bm25.search(query, n_dense), chunks, top_k, provenance)
+    _result_cache.put(result_key, [dict(r) for r in result])
+    return result
+
+def _fuse(dense, sparse, chunks, top_k, provenance=None):
+    """Reciprocal-rank fusion of dense hits and (ids, scores) from BM25."""
+    fused = {}
+    for rank, r in enumerate(dense):
+        fused[r["index"]] = dict(r, score=1.0 / (RRF_K + rank + 1), dense_score=r["score"])
+        fused[r["index"]].pop("norm_score", None)
+    for rank, (i, s) in enumerate(zip(*sparse)):
+        i = int(i)
+        if i not in fused:
+            fused[i] = {"chunk": chunks[i], "index": i, "score": 0.0}
+            if provenance is not None:
+                fused[i].update(provenance(i))
+        hit = fused[i]
+        hit["score"] += 1.0 / (RRF_K + rank + 1)
+        hit["bm25_score"] = float(s)
+    result = sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:top_k]
+    max_s = result[0]["score"] if result else 1.0
+    for r in result:
+        r["norm_score"] = r["score"] / max_s if max_s else r["score"]
+    return result
+
+def retrieve_many(queries, index, embeddings, chunks, top_k=5, nprobe=None, ef_search=None, index_version=None,
+                  bm25=None, mode="dense", provenance=None):
+    """
+    Batched retrieve(): one list of results per query, in input order.
+    Uncached queries are encoded in a single model call and searched with
+    a single index.search over the query matrix; in hybrid mode each
+    query's dense candidates are then fused with its own BM25 ranking.
+    Lexical mode needs no model and runs one retrieve() per query.
+    """
+    if mode != "dense" and bm25 is None:
+        raise ValueError(f"mode={mode!r} needs a bm25 index")
+    if mode == "lexical":
+        return [retrieve(q, index, embeddings, chunks, top_k, nprobe, ef_search, index_version, bm25, mode, provenance)
+                for q in queries]
+    version = (_index_token(index), index.ntotal if index_version is None else index_version)
+    keys = [(version, normalize_query(q), top_k, nprobe, ef_search, mode, provenance is not None) for q in queries]
+    results = [_result_cache.get(k) for k in keys]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if todo:
+        service = get_embedding_service()
+        vec_keys = [(service.cache_key, normalize_query(queries[i])) for i in todo]
+        vecs = [_query_cache.get(k) for k in vec_keys]
+        missing = [j for j, v in enumerate(vecs) if v is None]
+        if missing:
+            new = service.encode([queries[todo[j]] for j in missing])
+            for j, row in zip(missing, new):
+                vecs[j] = row[None, :]
+                _query_cache.put(vec_keys[j], vecs[j])
+
+        n_dense = top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+        set_search_params(index, nprobe, ef_search)
+        faiss_scores, idxs = index.search(np.vstack(vecs).astype("float32"), n_dense)
+        for row, i in enumerate(todo):
+            results[i] = _hits(faiss_scores[row], idxs[row], chunks, provenance)
+            if mode == "hybrid":
+                results[i] = _fuse(results[i], bm25.search(queries[i], n_dense), chunks, top_k, provenance)
+            _result_cache.put(keys[i], [dict(r) for r in results[i]])
+    return [[dict(r) for r in res] for res in results]
+
+def _hits(scores, ids, chunks, provenance=None):
     # faiss returns inner product values; convert to 0..1 roughly
-    raw_scores = faiss_scores[0].tolist()
     result = []
-    for i, score in zip(idxs[0], raw_scores):
+    for i, score in zip(ids, scores.tolist()):
         if i < 0:
             continue
-        result.append({"chunk": chunks[i], "index": int(i), "score": float(score)})
+        hit = {"chunk": chunks[i], "index": int(i), "score": float(score)}
+        if provenance is not None:
+            hit.update(provenance(int(i)))
+        result.append(hit)
     # normalized mapping
     max_s = max([r['score'] for r in result]) if result else 1.0
     for r in result: